@@ -1,10 +1,22 @@
+from __future__ import annotations
+
 import os
+import threading
+from typing import TYPE_CHECKING, Optional
 
-from cbpro import AuthenticatedClient as CBProClient
+if TYPE_CHECKING:
+    from cbpro import AuthenticatedClient as CBProClient
 
 
-def connect() -> CBProClient:
-    """Authenticate to the cbpro API"""
+def connect(pool_size: int = 16) -> CBProClient:
+    """
+    Authenticate to the cbpro API.
+    The client keeps up to pool_size keep-alive connections open, so it can be
+    shared by that many threads making requests concurrently.
+    """
+    # cbpro and requests take a while to import, only load them when needed
+    from cbpro import AuthenticatedClient as CBProClient
+    from requests.adapters import HTTPAdapter
 
     API_KEY = os.getenv('API_KEY')
     if API_KEY == None:
@@ -18,4 +30,38 @@ def connect() -> CBProClient:
     if API_PASSCODE == None:
         raise RuntimeError("API_PASSCODE environment variable is not set")
 
-    return CBProClient(API_KEY, API_SECRET, API_PASSCODE)
+    # point API_URL at the sandbox or a local mock exchange for testing
+    API_URL = os.getenv('API_URL', 'https://api.pro.coinbase.com')
+
+    client = CBProClient(API_KEY, API_SECRET, API_PASSCODE, API_URL)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client.session.mount('https://', adapter)
+    client.session.mount('http://', adapter)
+    return client
+
+
+class LazyClient:
+    """
+    Stand-in for the cbpro client that only connects on first use, so runs
+    that never touch the exchange, like offline backtests on cached candles,
+    don't pay for importing and authenticating it.
+    """
+    def __init__(self, pool_size: int = 16):
+        self.pool_size = pool_size
+        self.client: Optional[CBProClient] = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if name.startswith('__') or name in ('pool_size', 'client', 'lock'):
+            raise AttributeError(name)  # not set up yet, e.g. when unpickling
+        with self.lock:
+            if self.client is None:
+                self.client = connect(self.pool_size)
+        return getattr(self.client, name)
+
+    def __getstate__(self):
+        # worker processes connect on their own
+        return {'pool_size': self.pool_size}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['pool_size'])
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from candles import Candles
+from downloader import Downloader
+from utils import to_timestamp
+
+
+class EndOfData(Exception):
+    """Raised when a backtest tries to run past the end of its price data"""
+
+
+class PriceFeed:
+    """
+    In-memory close price series for offline backtests.
+    Prices are looked up with a binary search over the candle times, so a
+    TestTrader driven by a PriceFeed never touches the network once the
+    products it trades are loaded.
+    """
+    def __init__(self,
+                 start: datetime,
+                 end: datetime,
+                 granularity: int = 60,
+                 downloader: Optional[Downloader] = None):
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.downloader = downloader
+        self.series: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.data: dict[str, np.ndarray] = {}  # full candles, for matching
+
+    def add(self, product_id: str, candles: Candles):
+        """Add the price history of a product"""
+        self.series[product_id] = (np.ascontiguousarray(candles.time),
+                                   np.ascontiguousarray(candles.close))
+        self.data[product_id] = candles.data
+
+    def load(self, product_ids: list[str]):
+        """Load several products through the downloader at once"""
+        if self.downloader is None:
+            raise ValueError("PriceFeed has no downloader to load data with")
+        for product_id, candles in self.downloader.backfill_many(
+                product_ids, self.start, self.end, self.granularity).items():
+            self.add(product_id, candles)
+
+    def price(self, product_id: str, time: datetime) -> float:
+        """Get the close price of the last candle at or before time"""
+        if product_id not in self.series:
+            self.load([product_id])
+        times, closes = self.series[product_id]
+        index = np.searchsorted(times, to_timestamp(time), side='right') - 1
+        if index < 0:
+            raise ValueError(f"no {product_id} price data before {time}")
+        return float(closes[index])
+
+    def candles(self, product_id: str, start: datetime,
+                end: datetime) -> Candles:
+        """
+        Get the candles with start < time <= end, the ones that trade between
+        the prices at start and at end
+        """
+        if product_id not in self.data:
+            self.load([product_id])
+        times, _ = self.series[product_id]
+        lo, hi = np.searchsorted(times,
+                                 [to_timestamp(start),
+                                  to_timestamp(end)],
+                                 side='right')
+        return Candles(self.data[product_id][lo:hi])
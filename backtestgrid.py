@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import product as cartesian
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, NamedTuple, Optional
+
+import numpy as np
+from tabulate import tabulate
+
+from backtest import EndOfData, PriceFeed
+from candlestore import CandleStore
+from downloader import Downloader
+from sharedcandles import SharedCandles
+from strategy import Strategy
+from trader import TestTrader
+
+if TYPE_CHECKING:
+    from cbpro import AuthenticatedClient as CBProClient
+
+
+class BacktestJob(NamedTuple):
+    """One backtest of a grid"""
+    strategy_builder: Callable[[datetime], Strategy]  # must be picklable
+    parameters: dict[str, float]  # parameter values, unset ones are default
+    start: datetime
+    products: list[str]  # the strategy's universe, preloaded in the feed
+
+
+def grid(strategy_builders: list[Callable[[datetime], Strategy]],
+         parameter_sets: list[dict[str, float]], starts: list[datetime],
+         universes: list[list[str]]) -> list[BacktestJob]:
+    """Every combination of strategy, parameters, start time and products"""
+    return [
+        BacktestJob(*job) for job in cartesian(
+            strategy_builders, parameter_sets, starts, universes)
+    ]
+
+
+class _EquityTrader(TestTrader):
+    """TestTrader that records its portfolio value after every step"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.equity = [float(self.portfolio_value())]
+
+    def wait(self, delta: timedelta):
+        super().wait(delta)
+        self.equity.append(float(self.portfolio_value()))
+
+
+def run_grid(jobs: list[BacktestJob],
+             end: datetime,
+             usd: float = 100,
+             granularity: int = 60,
+             workers: Optional[int] = None,
+             downloader: Optional[Downloader] = None) -> list[dict]:
+    """
+    Backtest every job on a process pool.
+    Market data is downloaded once in this process: the price history of
+    every product is published in shared memory, and the data of each
+    strategy's download_data is warmed in the candle store, so the workers
+    only read it. Returns one row of results per job, in order.
+    """
+    if downloader is None:
+        import api  # only load the exchange client when it's needed
+        downloader = Downloader(api.connect())
+
+    print('Downloading data...')
+    warmed = set()
+    for job in jobs:
+        key = (job.strategy_builder, job.start,
+               tuple(sorted(job.parameters.items())), tuple(job.products))
+        if key not in warmed:
+            warmed.add(key)
+            _build_strategy(job, end).download_data(downloader)
+
+    start = min(job.start for job in jobs)
+    products = sorted({p for job in jobs for p in job.products})
+    shared = downloader.publish(products, start, end, granularity)
+
+    print(f'Running {len(jobs)} backtests...')
+    with shared, ProcessPoolExecutor(
+            workers,
+            initializer=_init_worker,
+            initargs=(downloader.client, downloader.store.root,
+                      shared)) as pool:
+        return list(
+            pool.map(
+                partial(_run_job, end=end, usd=usd, granularity=granularity),
+                jobs))
+
+
+def print_results(results: list[dict]):
+    """Print the results of run_grid as a table, best return first"""
+    rows = sorted(results, key=lambda row: row['return'], reverse=True)
+    print(
+        tabulate([{
+            **row, 'return': f"{row['return']:.2%}",
+            'max_drawdown': f"{row['max_drawdown']:.2%}",
+            'final_value': f"${row['final_value']:.2f}"
+        } for row in rows],
+                 headers='keys'))
+
+
+def max_drawdown(equity: np.ndarray) -> float:
+    """Largest drop from a peak, as a fraction of the peak"""
+    peaks = np.maximum.accumulate(equity)
+    return float(np.max(1 - equity / peaks))
+
+
+def _build_strategy(job: BacktestJob, end: datetime) -> Strategy:
+    strategy = job.strategy_builder(job.start)
+    for name, value in job.parameters.items():
+        strategy.parameters[name].set_value(value)
+    strategy.universe = list(job.products)
+    strategy.end_time = end
+    return strategy
+
+
+# downloader of the current worker process, set by _init_worker
+_worker_downloader: Optional[Downloader] = None
+
+
+def _init_worker(client: CBProClient, store_root: Path, shared: SharedCandles):
+    global _worker_downloader
+    _worker_downloader = Downloader(client,
+                                    store=CandleStore(store_root),
+                                    shared=shared)
+
+
+def _run_job(job: BacktestJob, end: datetime, usd: float,
+             granularity: int) -> dict:
+    downloader = _worker_downloader
+    prices = PriceFeed(job.start, end, granularity, downloader=downloader)
+    prices.load(job.products)
+    trader = _EquityTrader(downloader.client,
+                           usd=usd,
+                           time=job.start,
+                           log=False,
+                           prices=prices,
+                           limiter=downloader.limiter,
+                           fast=True)
+
+    strategy = _build_strategy(job, end)
+    strategy.download_data(downloader)
+    try:
+        strategy.trade(trader)
+    except EndOfData:
+        pass
+    trader.equity.append(float(trader.portfolio_value()))
+
+    equity = np.array(trader.equity)
+    name = getattr(job.strategy_builder, '__name__', job.strategy_builder)
+    return {
+        'strategy': name,
+        'parameters': job.parameters,
+        'start': job.start,
+        'products': ','.join(job.products),
+        'final_value': equity[-1],
+        'return': equity[-1] / usd - 1,
+        'max_drawdown': max_drawdown(equity),
+    }
@@ -0,0 +1,388 @@
+"""
+Benchmarks for the backtest and optimisation hot paths.
+Everything runs on seeded synthetic candles and a fake client, so results
+only depend on the code and the machine.
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from statistics import median
+from typing import Callable, Optional
+
+import numpy as np
+from tabulate import tabulate
+
+import indicators
+from backtest import PriceFeed
+from candles import CANDLE_DTYPE, Candles
+from candlestore import CandleStore
+from definitions import ROOT_DIR
+from downloader import Downloader
+from genetic import (Agent, ArrayGeneticAlgorithm, BatchEvaluator, Gene,
+                     GeneticAlgorithm)
+from orders import OrderType, Side
+from screener import Screener
+from trader import TestTrader
+from utils import RateLimiter, from_timestamp, to_timestamp
+
+START = datetime(2021, 9, 3)
+GRANULARITY = 60
+
+# metrics are named <what>_<unit>; these units mean higher is better
+HIGHER_IS_BETTER = ('per_sec', )
+
+Benchmark = Callable[[bool], dict[str, float]]
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(function: Benchmark) -> Benchmark:
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def synthetic_candles(count: int,
+                      start: datetime = START,
+                      granularity: int = GRANULARITY,
+                      seed: int = 0) -> Candles:
+    """Random walk candles, the same for the same arguments"""
+    rng = np.random.default_rng(seed)
+    data = np.empty(count, dtype=CANDLE_DTYPE)
+    data['time'] = to_timestamp(start) + granularity * np.arange(count)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, count)))
+    data['open'] = np.concatenate([[100], close[:-1]])
+    data['close'] = close
+    spread = np.abs(rng.normal(0, 0.001, count)) * close
+    data['high'] = np.maximum(data['open'], close) + spread
+    data['low'] = np.minimum(data['open'], close) - spread
+    data['volume'] = rng.exponential(10, count)
+    return Candles(data)
+
+
+class FakeClient:
+    """Serves synthetic candles like get_product_historic_rates"""
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self.requests = 0
+
+    def get_product_historic_rates(self, product_id: str, start: str, end: str,
+                                   granularity: int) -> list:
+        self.requests += 1
+        start = to_timestamp(datetime.fromisoformat(start))
+        end = to_timestamp(datetime.fromisoformat(end))
+        count = (end - start) // granularity + 1
+        candles = synthetic_candles(count, from_timestamp(start), granularity,
+                                    self.seed + start)
+        return candles.data.tolist()[::-1]  # newest first, like the api
+
+    def get_product_ticker(self, product_id: str) -> dict:
+        return {'price': '100'}
+
+
+def measure(function: Callable[[], object], repeat: int = 5) -> float:
+    """Median seconds per call of function"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+@benchmark
+def place_market_order(quick: bool) -> dict[str, float]:
+    orders = 2_000 if quick else 20_000
+    candles = synthetic_candles(10)
+    results = {}
+    for name, fast in (('decimal', False), ('fast', True)):
+        prices = PriceFeed(START, START + timedelta(days=1))
+        prices.add('BTC-USD', candles)
+
+        def run():
+            trader = TestTrader(None,
+                                usd=10**9,
+                                time=START,
+                                log=False,
+                                prices=prices,
+                                fast=fast)
+            for _ in range(orders // 2):
+                trader.place_market_order('BTC-USD', Side.BUY, Decimal('0.01'))
+                trader.place_market_order('BTC-USD', Side.SELL, Decimal(1))
+
+        results[f'{name}_orders_per_sec'] = orders / measure(run)
+    return results
+
+
+@benchmark
+def resting_orders(quick: bool) -> dict[str, float]:
+    steps = 2_000 if quick else 20_000
+    orders = 500
+    candles = synthetic_candles(steps + 1)
+    results = {}
+    for name, fast in (('decimal', False), ('fast', True)):
+        prices = PriceFeed(START, START + timedelta(minutes=steps + 1))
+        prices.add('BTC-USD', candles)
+
+        def run():
+            trader = TestTrader(None,
+                                usd=10**9,
+                                time=START,
+                                log=False,
+                                prices=prices,
+                                fast=fast)
+            trader.balance['BTC'] = trader.number(10**6)
+            # a grid of resting orders, mostly far from the price
+            for i in range(1, orders // 2 + 1):
+                for side, sign in ((Side.BUY, -1), (Side.SELL, 1)):
+                    trader.place_order('BTC-USD',
+                                       side,
+                                       OrderType.LIMIT,
+                                       size=1,
+                                       price=100 * (1 + sign * 0.001 * i))
+            for _ in range(steps):
+                trader.wait(timedelta(minutes=1))
+
+        results[f'{name}_candles_per_sec'] = steps / measure(run, repeat=3)
+    return results
+
+
+@benchmark
+def historical_data(quick: bool) -> dict[str, float]:
+    days = 2 if quick else 30
+    end = START + timedelta(days=days)
+
+    unlimited = RateLimiter(10**9)  # only measure our own overhead
+
+    def fetch(store: CandleStore) -> Candles:
+        downloader = Downloader(FakeClient(), store, limiter=unlimited)
+        return downloader.historical_data('BTC-USD', START, end, GRANULARITY)
+
+    def miss():
+        with tempfile.TemporaryDirectory() as empty:
+            fetch(CandleStore(empty))
+
+    with tempfile.TemporaryDirectory() as root:
+        fetch(CandleStore(root))
+        warm = CandleStore(root)
+        return {
+            'miss_ms': 1000 * measure(miss, repeat=3),
+            # store opened from scratch, series is read from disk
+            'hit_disk_ms': 1000 * measure(lambda: fetch(CandleStore(root))),
+            # series already mapped by the store
+            'hit_memory_ms': 1000 * measure(lambda: fetch(warm)),
+        }
+
+
+@benchmark
+def indicator_batch(quick: bool) -> dict[str, float]:
+    candles = synthetic_candles(100_000 if quick else 1_000_000)
+    close, window = candles.close, 60
+    functions = {
+        'avg_percent_volatility':
+        lambda: indicators.avg_percent_volatility(candles),
+        'rolling_mean':
+        lambda: indicators.rolling_mean(close, window),
+        'rolling_volatility':
+        lambda: indicators.rolling_volatility(candles, window),
+        'rolling_max':
+        lambda: indicators.rolling_max(close, window),
+        'ema':
+        lambda: indicators.ema(close, window),
+        'atr':
+        lambda: indicators.atr(candles, window),
+    }
+    return {
+        f'{name}_candles_per_sec': len(candles) / measure(function, repeat=3)
+        for name, function in functions.items()
+    }
+
+
+@benchmark
+def indicator_incremental(quick: bool) -> dict[str, float]:
+    candles = synthetic_candles(10_000 if quick else 100_000)
+    rows = candles.to_dicts()
+    window = 60
+    indicator_types = {
+        'rolling_mean': (indicators.RollingMean, 'close'),
+        'rolling_volatility': (indicators.RollingVolatility, None),
+        'rolling_max': (indicators.RollingMax, 'close'),
+        'ema': (indicators.EMA, 'close'),
+        'atr': (indicators.ATR, None),
+    }
+    results = {}
+    for name, (indicator_type, column) in indicator_types.items():
+        values = [row[column] for row in rows] if column else rows
+
+        def run():
+            update = indicator_type(window).update
+            for value in values:
+                update(value)
+
+        results[f'{name}_updates_per_sec'] = len(values) / measure(run,
+                                                                   repeat=3)
+    return results
+
+
+@benchmark
+def screener(quick: bool) -> dict[str, float]:
+    products = 50 if quick else 200
+    count = 1_440 if quick else 10_080
+    data = {
+        f'P{seed}-USD': synthetic_candles(count, seed=seed)
+        for seed in range(products)
+    }
+    window = 60
+
+    def per_product():
+        # what find_volatile_tickers used to do, at a single time
+        volatility = [(indicators.avg_percent_volatility(candles[-window:]),
+                       product_id) for product_id, candles in data.items()]
+        volatility.sort(reverse=True)
+
+    def every_step():
+        screened = Screener(data, GRANULARITY)
+        screened.top(screened.volatility(window), 10)
+
+    return {
+        'per_product_screens_per_sec': 1 / measure(per_product),
+        'vectorized_screens_per_sec': count / measure(every_step, repeat=3),
+    }
+
+
+@benchmark
+def genetic_algorithm(quick: bool) -> dict[str, float]:
+    generations = 5 if quick else 20
+    genes = 8
+    target = np.linspace(0, 1, genes)
+
+    def fitness(agent: Agent) -> float:
+        return -sum((g.value - t)**2 for g, t in zip(agent.genes, target))
+
+    def batch_fitness(genomes: np.ndarray) -> np.ndarray:
+        return -np.sum((genomes - target)**2, axis=1)
+
+    results = {}
+    # tournament selection of Agents is quadratic, keep their populations
+    # small and only scale up the array version
+    for size in (100, 1_000):
+        random.seed(0)
+        population = [
+            Agent([Gene() for _ in range(genes)]) for _ in range(size)
+        ]
+        algorithm = GeneticAlgorithm(fitness, population)
+        results[f'agents_{size}_generations_per_sec'] = generations / measure(
+            lambda: algorithm.run(generations), repeat=1)
+
+    for size in (100, 1_000) if quick else (100, 1_000, 10_000):
+        algorithm = ArrayGeneticAlgorithm(batch_fitness,
+                                          np.random.default_rng(0).random(
+                                              (size, genes)),
+                                          evaluator=BatchEvaluator(),
+                                          seed=0)
+        results[f'array_{size}_generations_per_sec'] = \
+            generations / measure(lambda: algorithm.run(generations),
+                                  repeat=1)
+    return results
+
+
+def run(names: list[str], quick: bool) -> dict:
+    results = {}
+    for name in names:
+        print(f'Running {name}...', file=sys.stderr)
+        results[name] = BENCHMARKS[name](quick)
+    return {
+        'commit': git_commit(),
+        'time': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'quick': quick,
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print the change of every metric, returns False on any regression"""
+    table = []
+    ok = True
+    for name, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            old = baseline['results'].get(name, {}).get(metric)
+            if old is None:
+                table.append([name, metric, '', f'{value:.4g}', ''])
+                continue
+            # > 1 means faster, whatever the unit
+            speedup = value / old if metric.endswith(
+                HIGHER_IS_BETTER) else old / value
+            regression = speedup < 1 - threshold
+            ok &= not regression
+            table.append([
+                name, metric, f'{old:.4g}', f'{value:.4g}',
+                f'{speedup:.2f}x' + (' REGRESSION' if regression else '')
+            ])
+    print(f"{baseline['commit']} -> {current['commit']}")
+    print(
+        tabulate(table,
+                 headers=['Benchmark', 'Metric', 'Before', 'After',
+                          'Speedup']))
+    return ok
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT_DIR,
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('names',
+                        nargs='*',
+                        help='benchmarks to run, all by default: ' +
+                        ', '.join(BENCHMARKS))
+    parser.add_argument('--quick',
+                        action='store_true',
+                        help='smaller inputs, for a quick check')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare',
+                        metavar='BASELINE',
+                        help='compare with results written by --output')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.1,
+                        help='slowdown that counts as a regression')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+
+    current = run(args.names or list(BENCHMARKS), args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(baseline, current, args.threshold):
+            sys.exit(1)
+    elif not args.output:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
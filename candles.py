@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from utils import to_timestamp
+
+# one row per candle, in the same column order as get_product_historic_rates
+CANDLE_DTYPE = np.dtype([('time', np.int64), ('low', np.float64),
+                         ('high', np.float64), ('open', np.float64),
+                         ('close', np.float64), ('volume', np.float64)])
+
+
+class Candles:
+    """
+    Candle history backed by a NumPy structured array.
+    The column properties and slicing return views, nothing is copied.
+    """
+    def __init__(self, data: Optional[np.ndarray] = None):
+        if data is None:
+            data = np.empty(0, dtype=CANDLE_DTYPE)
+        if data.dtype != CANDLE_DTYPE:
+            raise ValueError(f"expected dtype {CANDLE_DTYPE}")
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[float]]) -> Candles:
+        """Build from [time, low, high, open, close, volume] rows"""
+        return cls(np.array([tuple(r) for r in rows], dtype=CANDLE_DTYPE))
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.data['time']
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.data['low']
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.data['high']
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.data['open']
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.data['close']
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.data['volume']
+
+    def between(self, start: datetime, end: datetime) -> Candles:
+        """Get the candles with start <= time < end"""
+        lo, hi = np.searchsorted(self.time,
+                                 [to_timestamp(start),
+                                  to_timestamp(end)])
+        return Candles(self.data[lo:hi])
+
+    def to_dicts(self) -> list[dict[str, float]]:
+        """Convert to the list of dicts format used by the cbpro api"""
+        names = CANDLE_DTYPE.names
+        return [dict(zip(names, row)) for row in self.data.tolist()]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return Candles(self.data[index])
+        return dict(zip(CANDLE_DTYPE.names, self.data[index].tolist()))
+
+    def __repr__(self):
+        return f'Candles({len(self)} candles)'
@@ -0,0 +1,234 @@
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from time import time as now
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from candles import CANDLE_DTYPE
+from definitions import ROOT_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows, series are only locked within a process
+    fcntl = None
+
+
+class CandleStore:
+    """
+    Persistent candle storage, one series per (product, granularity).
+
+    Each series is an append-only binary file of CANDLE_DTYPE records sorted by
+    time, plus a small coverage file listing the [start, end) ranges that have
+    already been downloaded. Ranges are served by slicing the memory-mapped
+    series, so overlapping or adjacent windows share the same data and only
+    the missing gaps have to be fetched.
+    Several processes can share a root, writers take lock() first.
+    The store is kept under size_limit bytes by evict(), which deletes the
+    least recently loaded series first.
+    """
+    def __init__(self,
+                 root: Path = ROOT_DIR / 'cache' / 'candles',
+                 size_limit: Optional[int] = 2**30):
+        self.root = Path(root)
+        self.size_limit = size_limit  # None to keep everything
+        self._series: dict[tuple[str, int], np.ndarray] = {}
+        self._coverage: dict[tuple[str, int], np.ndarray] = {}
+
+    def get(self, product_id: str, granularity: int, start: int,
+            end: int) -> np.ndarray:
+        """Return the stored candles with start <= time < end"""
+        series = self._load_series(product_id, granularity)
+        lo, hi = np.searchsorted(series['time'], [start, end])
+        return series[lo:hi]
+
+    def missing(self, product_id: str, granularity: int, start: int,
+                end: int) -> list[tuple[int, int]]:
+        """Return the [start, end) ranges that have not been downloaded yet"""
+        start, end = align(start, end, granularity)
+        gaps = []
+        for covered_start, covered_end in self._load_coverage(
+                product_id, granularity):
+            if covered_end <= start:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > start:
+                gaps.append((start, int(covered_start)))
+            start = max(start, int(covered_end))
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def insert(self, product_id: str, granularity: int, start: int, end: int,
+               candles: np.ndarray):
+        """Store the candles downloaded for the range [start, end)"""
+        key = (product_id, granularity)
+        start, end = align(start, end, granularity)
+
+        # the current candle is still open, so don't mark it as downloaded
+        end = min(end, int(now()) // granularity * granularity)
+
+        candles = dedupe(candles.astype(CANDLE_DTYPE))
+        candles = candles[(candles['time'] >= start)
+                          & (candles['time'] < end)]
+
+        path = self._path(product_id, granularity)
+        path.mkdir(parents=True, exist_ok=True)
+
+        series = self._load_series(product_id, granularity)
+        if len(candles):
+            # common case: new data goes after everything we have
+            append = not len(series) or candles['time'][0] > series['time'][-1]
+            if not append:
+                # backfilling older data: merge and rewrite the series
+                candles = dedupe(np.concatenate([series, candles]))
+            # unmap the series first, Windows can't replace a mapped file
+            del series
+            self._series.pop(key, None)
+            if append:
+                with open(path / 'candles.bin', 'ab') as f:
+                    candles.tofile(f)
+            else:
+                _atomic_write(path / 'candles.bin', candles)
+
+        if start < end:
+            coverage = self._load_coverage(product_id, granularity)
+            coverage = merge_ranges(np.vstack([coverage, [[start, end]]]))
+            _atomic_write(path / 'coverage.bin', coverage)
+            self._coverage[key] = coverage
+
+    @contextmanager
+    def lock(self, product_id: str, granularity: int) -> Iterator[None]:
+        """
+        Hold an exclusive lock on a series, shared with other processes.
+        Another process may have written the series while we waited, so the
+        cached state is reloaded once the lock is acquired.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._lock_path(self._path(product_id, granularity))
+        with open(path, 'a') as f:  # closing the file releases the lock
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            self.refresh(product_id, granularity)
+            yield
+
+    def evict(self, keep: Iterable[tuple[str, int]] = ()) -> int:
+        """
+        Delete the least recently loaded series until the store fits in
+        size_limit, returns the number of bytes freed. The (product,
+        granularity) series in keep, and series that are locked for writing,
+        are skipped. Another process may still be reading an
+        evicted series from its memory map, it just downloads it again the
+        next time it asks for a missing range.
+        """
+        if self.size_limit is None or not self.root.exists():
+            return 0
+        kept = {self._path(*key) for key in keep}
+        series = []
+        for path in self.root.iterdir():
+            if path.is_dir() and path not in kept:
+                size = sum(file.stat().st_size for file in path.iterdir())
+                series.append((path.stat().st_mtime, size, path))
+        excess = sum(size for _, size, _ in series) - self.size_limit
+        freed = 0
+        for _, size, path in sorted(series):
+            if freed >= excess:
+                break
+            with open(self._lock_path(path), 'a') as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # being written
+                # unmap our own copy first, mapped files can't be deleted on
+                # Windows
+                for key in [
+                        key for key in {*self._series, *self._coverage}
+                        if self._path(*key) == path
+                ]:
+                    self.refresh(*key)
+                shutil.rmtree(path, ignore_errors=True)
+            if not path.exists():
+                freed += size
+        return freed
+
+    def refresh(self, product_id: str, granularity: int):
+        """Forget the cached state of a series, it's reloaded when needed"""
+        self._series.pop((product_id, granularity), None)
+        self._coverage.pop((product_id, granularity), None)
+
+    def _path(self, product_id: str, granularity: int) -> Path:
+        return self.root / f'{product_id}-{granularity}'
+
+    def _lock_path(self, path: Path) -> Path:
+        return path.with_name(f'{path.name}.lock')
+
+    def _load_series(self, product_id: str, granularity: int) -> np.ndarray:
+        key = (product_id, granularity)
+        if key not in self._series:
+            file = self._path(product_id, granularity) / 'candles.bin'
+            # another process may be appending, only map whole records
+            records = file.stat().st_size // CANDLE_DTYPE.itemsize \
+                if file.exists() else 0
+            if records == 0:
+                series = np.empty(0, dtype=CANDLE_DTYPE)
+            else:
+                series = np.memmap(file,
+                                   dtype=CANDLE_DTYPE,
+                                   mode='r',
+                                   shape=(records, ))
+                if np.any(np.diff(series['time']) <= 0):
+                    # an interrupted write left duplicates behind, compact it
+                    series = dedupe(np.array(series))  # unmaps the file
+                    _atomic_write(file, series)
+                try:
+                    os.utime(file.parent)  # evict() drops the oldest first
+                except FileNotFoundError:
+                    pass  # just evicted by another process
+            self._series[key] = series
+        return self._series[key]
+
+    def _load_coverage(self, product_id: str, granularity: int) -> np.ndarray:
+        key = (product_id, granularity)
+        if key not in self._coverage:
+            file = self._path(product_id, granularity) / 'coverage.bin'
+            if file.exists():
+                coverage = np.fromfile(file, dtype=np.int64).reshape(-1, 2)
+            else:
+                coverage = np.empty((0, 2), dtype=np.int64)
+            self._coverage[key] = coverage
+        return self._coverage[key]
+
+
+def align(start: int, end: int, granularity: int) -> tuple[int, int]:
+    """Widen [start, end) to whole candles"""
+    start = start // granularity * granularity
+    end = -(-end // granularity) * granularity  # round up
+    return start, end
+
+
+def dedupe(candles: np.ndarray) -> np.ndarray:
+    """Sort candles by time, keeping one candle per timestamp"""
+    _, index = np.unique(candles['time'], return_index=True)
+    return candles[index]
+
+
+def merge_ranges(ranges: np.ndarray) -> np.ndarray:
+    """Merge overlapping or adjacent [start, end) ranges"""
+    ranges = ranges[np.argsort(ranges[:, 0])]
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype=np.int64).reshape(-1, 2)
+
+
+def _atomic_write(file: Path, array: np.ndarray):
+    tmp = file.with_suffix('.tmp')
+    array.tofile(tmp)
+    os.replace(tmp, file)
@@ -0,0 +1,115 @@
+"""
+Run strategies from the command line.
+
+    python -m cli list
+    python -m cli run StupidStrategy --end 2021-09-05
+    python -m cli live JadensStategy ETH-USD
+
+Strategies are found by parsing the modules in the project, only the module
+of the strategy that is run gets imported.
+"""
+import argparse
+import ast
+import importlib
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from definitions import ROOT_DIR
+
+
+class StrategyInfo(NamedTuple):
+    module: str
+    name: str
+    doc: Optional[str]
+
+
+def discover(root: Path = ROOT_DIR) -> list[StrategyInfo]:
+    """Find every Strategy subclass without importing anything"""
+    classes: dict[str, tuple[str, list[str], Optional[str]]] = {}
+    for path in sorted(root.glob('*.py')):
+        source = path.read_text()
+        if 'Strategy' not in source:
+            continue
+        for node in ast.parse(source, str(path)).body:
+            if isinstance(node, ast.ClassDef):
+                bases = [
+                    base.id for base in node.bases
+                    if isinstance(base, ast.Name)
+                ]
+                classes[node.name] = (path.stem, bases,
+                                      ast.get_docstring(node))
+
+    def is_strategy(name: str, seen: frozenset = frozenset()) -> bool:
+        if name == 'Strategy':
+            return True
+        if name not in classes or name in seen:
+            return False
+        return any(
+            is_strategy(base, seen | {name}) for base in classes[name][1])
+
+    return [
+        StrategyInfo(module, name, doc)
+        for name, (module, _, doc) in classes.items()
+        if name != 'Strategy' and is_strategy(name)
+    ]
+
+
+def load(name: str) -> type:
+    """Import a strategy class by class name, or module:class"""
+    module, _, class_name = name.rpartition(':')
+    matches = [
+        info for info in discover()
+        if info.name.lower() == class_name.lower() and (
+            not module or info.module == module)
+    ]
+    if not matches:
+        raise SystemExit(f"unknown strategy {name}, see 'python -m cli list'")
+    if len(matches) > 1:
+        raise SystemExit(f"{name} is ambiguous, use module:class")
+    info = matches[0]
+    return getattr(importlib.import_module(info.module), info.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m cli',
+                                     description='Run trading strategies')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='list the available strategies')
+
+    run = commands.add_parser('run', help='run a strategy on a TestTrader')
+    run.add_argument('strategy')
+    run.add_argument('--start',
+                     type=datetime.fromisoformat,
+                     help='simulated start time (UTC)')
+    run.add_argument('--end',
+                     type=datetime.fromisoformat,
+                     help='backtest offline on cached candles until then')
+    run.add_argument('--profile',
+                     metavar='PATH',
+                     help='profile the run and save the stats')
+
+    live = commands.add_parser('live',
+                               help='run a strategy on the live market')
+    live.add_argument('strategy')
+    live.add_argument('products', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        for info in discover():
+            summary = (info.doc or '').split('\n')[0]
+            print(f'{info.module + ":" + info.name:40} {summary}')
+    elif args.command == 'run':
+        from main import run_strategy
+        run_strategy(load(args.strategy),
+                     end=args.end,
+                     profile=args.profile,
+                     start=args.start)
+    elif args.command == 'live':
+        from main import run_live
+        run_live(load(args.strategy), args.products)
+
+
+if __name__ == '__main__':
+    main()
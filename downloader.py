@@ -1,10 +1,23 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timedelta
-from utils import memoize_diskcache
+from utils import RateLimiter, from_timestamp, memoize_diskcache, to_timestamp
 from definitions import ROOT_DIR
-from functools import wraps
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional
 
 import diskcache
-from cbpro import AuthenticatedClient as CBProClient
+
+import instrument
+from candles import Candles
+from candlestore import CandleStore
+from sharedcandles import SharedCandles
+
+if TYPE_CHECKING:
+    from cbpro import AuthenticatedClient as CBProClient
 
 cache = diskcache.Cache(ROOT_DIR / 'cache')
 
@@ -13,20 +26,46 @@ class Downloader:
     MAX_CANDLES = 300  # as per get_product_historic_rates docs
     ALLOWED_GRANULARITIES = [60, 300, 900, 3600, 21600,
                              86400]  # from api error message
+    REQUESTS_PER_SECOND = 10  # public endpoint rate limit
+    MAX_RETRIES = 5
 
-    def __init__(self, client: CBProClient):
+    def __init__(self,
+                 client: CBProClient,
+                 store: Optional[CandleStore] = None,
+                 max_workers: int = 8,
+                 limiter: Optional[RateLimiter] = None,
+                 shared: Optional[SharedCandles] = None):
+        """
+        Ranges covered by shared, e.g. data published by a parent process,
+        are served from it without touching the store or the network.
+        """
         self.client = client
+        self.store = store or CandleStore()
+        self.max_workers = max_workers
+        self.limiter = limiter or RateLimiter(self.REQUESTS_PER_SECOND)
+        self.shared = shared
 
-    @memoize_diskcache(cache)
+    @memoize_diskcache(cache, version=2, expire=24 * 60 * 60)  # rarely change
     def product_list(self) -> list[dict[str, str]]:
         return self.client.get_products()
 
-    # TODO improved historical data cache
-    @memoize_diskcache(cache)
-    def historical_data(self, ticker: str, start: datetime,
-                        end: datetime) -> list[dict[str, float]]:
-        duration = end - start
+    def historical_data(self,
+                        ticker: str,
+                        start: datetime,
+                        end: datetime,
+                        granularity: Optional[int] = None) -> Candles:
+        """
+        Get the candles in the range [start, end).
+        If granularity isn't given, the smallest one that covers the range in
+        MAX_CANDLES candles is used.
+        """
+        if granularity is None:
+            granularity = self.granularity_for(end - start)
+
+        return self.backfill(ticker, start, end, granularity)
 
+    def granularity_for(self, duration: timedelta) -> int:
+        """Get the smallest granularity that fits duration in MAX_CANDLES"""
         # can't have more than MAX_CANDLES datapoints
         min_granularity = duration.total_seconds() / self.MAX_CANDLES
 
@@ -36,15 +75,118 @@ class Downloader:
         ]
         if not valid_granularities:
             raise RuntimeError("Period is too large")
-        granularity = valid_granularities[0]
-
-        return [{
-            'time': time,
-            'low': low,
-            'high': high,
-            'open': open_price,
-            'close': close,
-            'volume': volume
-        } for time, low, high, open_price, close, volume
-                in self.client.get_product_historic_rates(
-                    ticker, start.isoformat(), end.isoformat(), granularity)]
+        return valid_granularities[0]
+
+    def backfill(self, ticker: str, start: datetime, end: datetime,
+                 granularity: int) -> Candles:
+        """Download every missing candle in [start, end) and return them all"""
+        return self.backfill_many([ticker], start, end, granularity)[ticker]
+
+    def backfill_many(self, tickers: list[str], start: datetime,
+                      end: datetime,
+                      granularity: int) -> dict[str, Candles]:
+        """
+        Download every missing candle in [start, end) for several products.
+        Missing ranges are split into MAX_CANDLES pages, which are fetched
+        concurrently by up to max_workers threads and paced by the rate
+        limiter.
+        Processes sharing a store download each series once: the series are
+        locked while downloading, and whoever waited for the lock only
+        fetches what is still missing after it.
+        """
+        if granularity not in self.ALLOWED_GRANULARITIES:
+            raise ValueError(f"granularity must be one of "
+                             f"{self.ALLOWED_GRANULARITIES}")
+        start, end = to_timestamp(start), to_timestamp(end)
+        started = perf_counter()
+
+        if self.shared and all(
+                self.shared.covers(ticker, granularity, start, end)
+                for ticker in tickers):
+            instrument.count('downloader.shared')
+            return {
+                ticker: self.shared.get(ticker, granularity, start, end)
+                for ticker in tickers
+            }
+
+        pages = self.missing_pages(tickers, start, end, granularity)
+        if pages:
+            with ExitStack() as locks:
+                # always lock in the same order so processes can't deadlock
+                for ticker in sorted({ticker for ticker, _, _ in pages}):
+                    locks.enter_context(self.store.lock(ticker, granularity))
+                missing = len(pages)
+                pages = self.missing_pages(tickers, start, end, granularity)
+                instrument.count('downloader.coalesced', missing - len(pages))
+                self.download_pages(pages, granularity)
+
+        result = {
+            ticker: Candles(self.store.get(ticker, granularity, start, end))
+            for ticker in tickers
+        }
+        if pages:
+            self.store.evict(keep=[(ticker, granularity)
+                                   for ticker in tickers])
+        instrument.record(
+            'downloader.backfill.' + ('miss' if pages else 'hit'),
+            perf_counter() - started)
+        return result
+
+    def missing_pages(self, tickers: list[str], start: int, end: int,
+                      granularity: int) -> list[tuple[str, int, int]]:
+        """Get the (ticker, start, end) pages the store is missing"""
+        page_size = self.MAX_CANDLES * granularity
+        return [(ticker, page_start, min(page_start + page_size, gap_end))
+                for ticker in tickers
+                for gap_start, gap_end in self.store.missing(
+                    ticker, granularity, start, end)
+                for page_start in range(gap_start, gap_end, page_size)]
+
+    def download_pages(self, pages: list[tuple[str, int, int]],
+                       granularity: int):
+        """Fetch pages concurrently and insert them in the store"""
+        instrument.count('downloader.pages', len(pages))
+        if not pages:
+            return
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            results = pool.map(
+                lambda page: self.fetch_candles(*page, granularity), pages)
+            # results come back in order, so pages get appended in order
+            for (ticker, page_start, page_end), candles in zip(pages, results):
+                self.store.insert(ticker, granularity, page_start, page_end,
+                                  candles.data)
+
+    def publish(self, tickers: list[str], start: datetime, end: datetime,
+                granularity: int) -> SharedCandles:
+        """
+        Backfill tickers and copy them into a new shared memory block, which
+        worker processes read through Downloader(shared=...). The caller
+        owns the block and has to close it.
+        """
+        data = self.backfill_many(tickers, start, end, granularity)
+        covered = (to_timestamp(start), to_timestamp(end))
+        return SharedCandles.publish({
+            (ticker, granularity): (*covered, candles)
+            for ticker, candles in data.items()
+        })
+
+    def fetch_candles(self, ticker: str, start: int, end: int,
+                      granularity: int) -> Candles:
+        """Download at most MAX_CANDLES candles in the range [start, end)"""
+        for attempt in range(self.MAX_RETRIES):
+            self.limiter.acquire()
+            with instrument.timer('api.get_product_historic_rates'):
+                rates = self.client.get_product_historic_rates(
+                    ticker,
+                    from_timestamp(start).isoformat(),
+                    from_timestamp(end - granularity).isoformat(),
+                    granularity)
+            if not isinstance(rates, dict):
+                return Candles.from_rows(rates)
+
+            # cbpro returns errors instead of raising
+            message = rates.get('message', str(rates))
+            if 'rate limit' not in message.lower():
+                raise RuntimeError(message)
+            time.sleep(2**attempt / self.REQUESTS_PER_SECOND)  # back off
+        raise RuntimeError(message)
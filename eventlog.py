@@ -0,0 +1,131 @@
+import queue
+import threading
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from orders import OrderStatus, OrderType, Side, format_order
+from utils import from_timestamp, to_timestamp
+
+SIDES = list(Side)
+ORDER_TYPES = list(OrderType)
+ORDER_STATUSES = list(OrderStatus)
+
+# one fixed-size record per order event, enums are stored as list indices
+ORDER_EVENT_DTYPE = np.dtype([('time', np.int64), ('coin', 'S8'),
+                              ('currency', 'S8'), ('side', np.uint8),
+                              ('order_type', np.uint8),
+                              ('order_status', np.uint8),
+                              ('is_real', np.bool_), ('price', np.float64),
+                              ('size', np.float64), ('unit_price', np.float64),
+                              ('fee', np.float64)])
+
+Consumer = Callable[[np.ndarray], None]
+
+
+class OrderEventLog:
+    """
+    Structured order log.
+    Events are written into preallocated batches of ORDER_EVENT_DTYPE records
+    that are recycled like a ring buffer. Full batches are handed to a
+    background thread that appends them to an optional binary file and passes
+    them to consumers, so recording an event never waits on I/O unless the
+    writer falls a whole ring behind. Events can be recorded from several
+    threads; a consumer that raises is reported and skipped.
+    """
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 consumers: Iterable[Consumer] = (),
+                 batch_size: int = 4096,
+                 batches: int = 4):
+        self.path = Path(path) if path else None
+        self.consumers = list(consumers)
+        self.free: queue.Queue[np.ndarray] = queue.Queue()
+        for _ in range(batches):
+            self.free.put(np.empty(batch_size, dtype=ORDER_EVENT_DTYPE))
+        self.full: queue.Queue[Optional[tuple[np.ndarray, int]]] = \
+            queue.Queue()
+        self.batch = self.free.get()
+        self.count = 0
+        self.lock = threading.Lock()  # guards batch and count
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def record(self, coin_name: str, currency_name: str, side: Side,
+               order_type: OrderType, order_status: OrderStatus, price: float,
+               size: float, unit_price: float, fee_amount: float,
+               order_time: datetime, is_real: bool):
+        event = (to_timestamp(order_time), coin_name.encode(),
+                 currency_name.encode(), SIDES.index(side),
+                 ORDER_TYPES.index(order_type),
+                 ORDER_STATUSES.index(order_status), is_real, price, size,
+                 unit_price, fee_amount)
+        with self.lock:
+            self.batch[self.count] = event
+            self.count += 1
+            if self.count == len(self.batch):
+                self._flush()
+
+    def flush(self):
+        """Hand the current batch to the writer"""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.count:
+            self.full.put((self.batch, self.count))
+            self.batch = self.free.get()  # blocks if the writer is behind
+            self.count = 0
+
+    def close(self):
+        """Flush everything and stop the writer"""
+        self.flush()
+        self.full.put(None)
+        self.writer.join()
+
+    def _write(self):
+        file = open(self.path, 'ab') if self.path else None
+        try:
+            while (item := self.full.get()) is not None:
+                batch, count = item
+                try:
+                    if file:
+                        batch[:count].tofile(file)
+                        file.flush()
+                except OSError:
+                    traceback.print_exc()
+                for consumer in self.consumers:
+                    try:
+                        consumer(batch[:count])
+                    except Exception:
+                        traceback.print_exc()  # keep the writer alive
+                self.free.put(batch)
+        finally:
+            if file:
+                file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_events(path: Path) -> np.ndarray:
+    """Memory-map an order event file written by OrderEventLog"""
+    return np.memmap(path, dtype=ORDER_EVENT_DTYPE, mode='r')
+
+
+def render(events: np.ndarray):
+    """Print order event records like Trader.log_order does"""
+    for event in events.tolist():
+        (time, coin, currency, side, order_type, order_status, is_real, price,
+         size, unit_price, fee) = event
+        print(
+            format_order(coin.decode(), currency.decode(), SIDES[side],
+                         ORDER_TYPES[order_type], ORDER_STATUSES[order_status],
+                         price, size, unit_price, fee, from_timestamp(time),
+                         is_real))
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
-from random import choice, randint, random, sample
+import os
+import pickle
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from random import choice, getstate, randint, random, sample, setstate
 from statistics import NormalDist
-from typing import Callable, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Optional, Sequence, Tuple, Union
 
+import numpy as np
+
+import instrument
 from utils import clamp, grouper  # allow type hints without ''
 
+if TYPE_CHECKING:
+    import diskcache
+
 
 class Gene:
     MIN = 0
     MAX = 1
     """A floating-point number in the range [0, 1)"""
     def __init__(self, value: Optional[float] = None):
-        self.value: float = value or random()
+        self.value: float = random() if value is None else value
 
     def copy(self) -> Gene:
         return Gene(self.value)
@@ -31,11 +42,171 @@ class Agent:
         return f'Agent([{genes}])'
 
 
+class SerialEvaluator:
+    """Score agents one after another in the current process"""
+    def evaluate(self, fitness_function: Callable[[Agent], float],
+                 agents: list[Agent]) -> list[float]:
+        return [fitness_function(agent) for agent in agents]
+
+    def close(self):
+        pass
+
+
+class PoolEvaluator:
+    """
+    Score agents in parallel on a process (or thread) pool.
+    Worker processes receive the fitness function, and any data it holds on
+    to, once when the pool starts, so only agents and scores are pickled for
+    each task.
+    """
+    def __init__(self,
+                 workers: Optional[int] = None,
+                 chunksize: Optional[int] = None,
+                 threads: bool = False):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.threads = threads
+        self.pool: Optional[Executor] = None
+        self.fitness_function = None
+
+    def evaluate(self, fitness_function: Callable[[Agent], float],
+                 agents: list[Agent]) -> list[float]:
+        if self.pool is None or fitness_function is not self.fitness_function:
+            self.start(fitness_function)
+
+        # a few chunks per worker keeps them busy without much overhead
+        chunksize = self.chunksize or max(1, len(agents) // (self.workers * 4))
+        task = fitness_function if self.threads else _evaluate_in_worker
+        return list(self.pool.map(task, agents, chunksize=chunksize))
+
+    def start(self, fitness_function: Callable[[Agent], float]):
+        self.close()
+        self.fitness_function = fitness_function
+        if self.threads:
+            self.pool = ThreadPoolExecutor(self.workers)
+        else:
+            self.pool = ProcessPoolExecutor(self.workers,
+                                            initializer=_init_worker,
+                                            initargs=(fitness_function, ))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self) -> PoolEvaluator:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BatchEvaluator:
+    """
+    Score the whole population with one call to a vectorized fitness function.
+    The fitness function takes an (agents x genes) array and returns one
+    score per agent, e.g. Strategy.batch_fitness.
+    """
+    def evaluate(self, fitness_function: Callable[[np.ndarray], np.ndarray],
+                 agents: list[Agent]) -> list[float]:
+        if not agents:
+            return []
+        return self.evaluate_genomes(fitness_function,
+                                     agents_to_genomes(agents)).tolist()
+
+    def evaluate_genomes(self, fitness_function: Callable[[np.ndarray],
+                                                          np.ndarray],
+                         genomes: np.ndarray) -> np.ndarray:
+        """Score an (agents x genes) array without building Agents"""
+        return np.asarray(fitness_function(genomes), dtype=np.float64)
+
+    def close(self):
+        pass
+
+
+Evaluator = Union[SerialEvaluator, PoolEvaluator, BatchEvaluator]
+
+# fitness function of the current worker process, set by _init_worker
+_worker_fitness_function: Optional[Callable[[Agent], float]] = None
+
+
+def _init_worker(fitness_function: Callable[[Agent], float]):
+    global _worker_fitness_function
+    _worker_fitness_function = fitness_function
+
+
+def _evaluate_in_worker(agent: Agent) -> float:
+    return _worker_fitness_function(agent)
+
+
+class FitnessCache:
+    """
+    Bounded LRU cache of fitness scores keyed on an agent's genome.
+    Genes are rounded to precision decimals so agents that only differ by
+    floating point noise share an entry. Scores can also be persisted across
+    runs in a diskcache.Cache, in which case namespace should identify the
+    fitness function and the data it was evaluated on.
+    """
+    def __init__(self,
+                 maxsize: int = 100_000,
+                 precision: int = 9,
+                 disk: Optional[diskcache.Cache] = None,
+                 namespace: str = ''):
+        self.maxsize = maxsize
+        self.precision = precision
+        self.disk = disk
+        self.namespace = namespace
+        self.entries: OrderedDict[tuple[float, ...], float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, agent: Agent) -> tuple[float, ...]:
+        return tuple(round(g.value, self.precision) for g in agent.genes)
+
+    def get(self, key: tuple[float, ...]) -> Optional[float]:
+        """Look up a score, returns None on a miss"""
+        score = self.entries.get(key)
+        if score is None and self.disk is not None:
+            score = self.disk.get(self._disk_key(key))
+            if score is not None:
+                self._remember(key, score)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return score
+
+    def set(self, key: tuple[float, ...], score: float):
+        self._remember(key, score)
+        if self.disk is not None:
+            self.disk.set(self._disk_key(key), score)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def _remember(self, key: tuple[float, ...], score: float):
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)  # evict least recently used
+
+    def _disk_key(self, key: tuple[float, ...]) -> tuple:
+        return ('fitness', self.namespace) + key
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
 class GeneticAlgorithm:
     def __init__(self,
                  fitness_function: Callable[[Agent], float],
                  population: list[Agent],
-                 mutation_chance: Optional[float] = None):
+                 mutation_chance: Optional[float] = None,
+                 evaluator: Optional[Evaluator] = None,
+                 cache: Optional[FitnessCache] = None):
         if not population:
             raise ValueError("population is empty")
         if len(population) % 2 != 0:
@@ -44,21 +215,103 @@ class GeneticAlgorithm:
         self.fitness_function = fitness_function
         self.population = population
         self.mutation_chance = mutation_chance or 1 / len(population[0].genes)
-
-    def run(self, iterations: int = 1) -> Tuple[Agent, float]:
+        self.evaluator = evaluator or SerialEvaluator()
+        self.cache = cache
+
+        self.generation = 0
+        self.scores: Sequence[float] = []  # of the last evaluated generation
+        self.best: Optional[Tuple[Agent, float]] = None
+        self.stale = 0  # generations since the best score improved
+
+    CHECKPOINT_VERSION = 1
+
+    def run(self,
+            iterations: int = 1,
+            checkpoint: Optional[Path] = None,
+            checkpoint_every: int = 1,
+            patience: Optional[int] = None,
+            min_delta: float = 0) -> Tuple[Agent, float]:
+        """
+        Run up to iterations more generations, returns the best agent so far.
+        With checkpoint, the state is saved to that file every
+        checkpoint_every generations, at the end and when interrupted; see
+        load_checkpoint(). With patience, stop early once the best score
+        hasn't improved by more than min_delta for that many generations.
+        """
+        try:
+            for _ in range(iterations):
+                with instrument.timer('ga.generation'):
+                    population, scores = self.run_single_iteration()
+                self.generation += 1
+                self.scores = scores
+
+                # get best performing agent from population
+                agent, score = self.fittest(population, scores)
+                improved = (self.best is None
+                            or score - self.best[1] > min_delta)
+                if self.best == None or score > self.best[1]:
+                    self.best = (agent, score)
+                self.stale = 0 if improved else self.stale + 1
+
+                if checkpoint and self.generation % checkpoint_every == 0:
+                    self.save_checkpoint(checkpoint)
+                if patience is not None and self.stale >= patience:
+                    break
+        except KeyboardInterrupt:
+            if checkpoint:
+                self.save_checkpoint(checkpoint)
+            raise
+        if checkpoint and self.generation % checkpoint_every != 0:
+            self.save_checkpoint(checkpoint)
+        instrument.report()
+        return self.best
+
+    def get_state(self) -> dict:
+        """Everything needed to resume the run, except the fitness function"""
         best = None
-        for generation in range(iterations):
-            population, scores = self.run_single_iteration()
-
-            # get best performing agent from population
-            agent, score = sorted(zip(population, scores),
-                                  key=lambda x: x[1])[-1]
-            if best == None or score > best[1]:
-                best = (agent, score)
-        return best
+        if self.best is not None:
+            agent, score = self.best
+            best = ([gene.value for gene in agent.genes], score)
+        return {
+            'version': self.CHECKPOINT_VERSION,
+            'generation': self.generation,
+            'genomes': agents_to_genomes(self.population),
+            'scores': self.scores,
+            'best': best,
+            'stale': self.stale,
+            'random_state': getstate(),
+        }
+
+    def set_state(self, state: dict):
+        if state.get('version') != self.CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version "
+                             f"{state.get('version')}")
+        self.generation = state['generation']
+        self.population = genomes_to_agents(state['genomes'])
+        self.scores = state['scores']
+        best = state['best']
+        self.best = None if best is None else (Agent(
+            [Gene(value) for value in best[0]]), best[1])
+        self.stale = state['stale']
+        setstate(state['random_state'])
+
+    def save_checkpoint(self, path: Path):
+        """Atomically write the state to path"""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.get_state(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def load_checkpoint(self, path: Path):
+        """Resume from a checkpoint written by save_checkpoint()"""
+        with open(path, 'rb') as f:
+            self.set_state(pickle.load(f))
 
     def run_single_iteration(self) -> Tuple[list[Agent], list[float]]:
-        scores = [fitness(c) for c in self.population]
+        scores = self.evaluate(self.population)
         parents = [
             tournament_selection(self.population, scores)
             for _ in range(len(self.population))
@@ -76,12 +329,169 @@ class GeneticAlgorithm:
 
         return prev_generation, scores
 
+    def fittest(self, population: list[Agent],
+                scores: list[float]) -> Tuple[Agent, float]:
+        """The best scoring agent of an evaluated generation"""
+        return max(zip(population, scores), key=lambda x: x[1])
+
+    def evaluate(self, agents: list[Agent]) -> list[float]:
+        """Score agents with the fitness function"""
+        if self.cache is None:
+            instrument.count('ga.fitness', len(agents))
+            with instrument.timer('ga.evaluate'):
+                return self.evaluator.evaluate(self.fitness_function, agents)
+
+        # only evaluate each genome that isn't cached once
+        keys = [self.cache.key(agent) for agent in agents]
+        scores: dict[tuple[float, ...], float] = {}
+        pending: dict[tuple[float, ...], Agent] = {}
+        for key, agent in zip(keys, agents):
+            if key in scores or key in pending:
+                continue
+            score = self.cache.get(key)
+            if score is None:
+                pending[key] = agent
+            else:
+                scores[key] = score
+
+        instrument.count('ga.fitness', len(pending))
+        instrument.count('ga.fitness.cached', len(agents) - len(pending))
+        with instrument.timer('ga.evaluate'):
+            results = self.evaluator.evaluate(self.fitness_function,
+                                              list(pending.values()))
+        for key, score in zip(pending, results):
+            self.cache.set(key, score)
+            scores[key] = score
+        return [scores[key] for key in keys]
+
     def mutate(self, child):
         for gene in child.genes:
             if random() < self.mutation_chance:
                 mutate(child, gene)
 
 
+class ArrayGeneticAlgorithm(GeneticAlgorithm):
+    """
+    GeneticAlgorithm that stores the population as an (agents x genes) array.
+    Selection, crossover and mutation are vectorized over the whole
+    population. With a BatchEvaluator and no cache the genomes are scored
+    directly and an Agent is only built for the best genome.
+    """
+    def __init__(self,
+                 fitness_function: Callable[[Agent], float],
+                 population: list[Agent] | np.ndarray,
+                 mutation_chance: Optional[float] = None,
+                 evaluator: Optional[Evaluator] = None,
+                 cache: Optional[FitnessCache] = None,
+                 cross_rate: float = 0.9,
+                 reset_rate: float = 0.1,
+                 tournament_size: int = 3,
+                 seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+        self.cross_rate = cross_rate
+        self.reset_rate = reset_rate
+        self.tournament_size = tournament_size
+        if isinstance(population, np.ndarray):
+            population = genomes_to_agents(population)
+        super().__init__(fitness_function, population, mutation_chance,
+                         evaluator, cache)
+
+    def get_state(self) -> dict:
+        state = super().get_state()
+        state['rng_state'] = self.rng.bit_generator.state
+        return state
+
+    def set_state(self, state: dict):
+        super().set_state(state)
+        self.rng.bit_generator.state = state['rng_state']
+
+    @property
+    def population(self) -> list[Agent]:
+        return genomes_to_agents(self.genomes)
+
+    @population.setter
+    def population(self, population: list[Agent]):
+        self.genomes = agents_to_genomes(population)
+
+    def run_single_iteration(self) -> Tuple[np.ndarray, np.ndarray]:
+        genomes = self.genomes
+        scores = self.evaluate_genomes(genomes)
+
+        parents = genomes[self.tournament_selection(scores)]
+        children = self.crossover(parents)
+        self.mutate_genomes(children)
+
+        # replace population
+        self.genomes = children
+
+        return genomes, scores
+
+    def evaluate_genomes(self, genomes: np.ndarray) -> np.ndarray:
+        """Score an (agents x genes) array with the fitness function"""
+        if self.cache is not None or not isinstance(self.evaluator,
+                                                    BatchEvaluator):
+            return np.asarray(self.evaluate(genomes_to_agents(genomes)),
+                              dtype=np.float64)
+        instrument.count('ga.fitness', len(genomes))
+        with instrument.timer('ga.evaluate'):
+            return self.evaluator.evaluate_genomes(self.fitness_function,
+                                                   genomes)
+
+    def fittest(self, genomes: np.ndarray,
+                scores: np.ndarray) -> Tuple[Agent, float]:
+        best = int(np.argmax(scores))
+        return Agent([Gene(value) for value in genomes[best].tolist()
+                      ]), float(scores[best])
+
+    def tournament_selection(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Run one tournament per agent and return the indices of the winners.
+        Unlike tournament_selection(), entrants are drawn with replacement.
+        """
+        n = len(scores)
+        entrants = self.rng.integers(n, size=(n, self.tournament_size))
+        winners = np.argmax(scores[entrants], axis=1)
+        return entrants[np.arange(n), winners]
+
+    def crossover(self, parents: np.ndarray) -> np.ndarray:
+        """One-point crossover of consecutive pairs of parents"""
+        p1, p2 = parents[0::2], parents[1::2]
+        pairs, genes = p1.shape
+        points = self.rng.integers(0, genes + 1, size=pairs)
+        points[self.rng.random(pairs) >= self.cross_rate] = 0  # no crossover
+
+        # swap all genes before the crossover point
+        swap = np.arange(genes) < points[:, None]
+        children = np.empty_like(parents)
+        children[0::2] = np.where(swap, p2, p1)
+        children[1::2] = np.where(swap, p1, p2)
+        return children
+
+    def mutate_genomes(self, genomes: np.ndarray):
+        """Vectorized version of mutate() over every gene, in place"""
+        shape = genomes.shape
+        mutated = self.rng.random(shape) < self.mutation_chance
+        reset = self.rng.random(shape) < self.reset_rate
+
+        ddof = 1 if shape[1] > 1 else 0
+        mean = genomes.mean(axis=1, keepdims=True)
+        std = genomes.std(axis=1, ddof=ddof, keepdims=True)
+        sampled = np.clip(self.rng.normal(mean, std, shape), Gene.MIN,
+                          np.nextafter(Gene.MAX, Gene.MIN))
+
+        new = np.where(reset, self.rng.random(shape), sampled)
+        genomes[mutated] = new[mutated]
+
+
+def agents_to_genomes(agents: list[Agent]) -> np.ndarray:
+    return np.array([[g.value for g in agent.genes] for agent in agents],
+                    dtype=np.float64)
+
+
+def genomes_to_agents(genomes: np.ndarray) -> list[Agent]:
+    return [Agent([Gene(value) for value in row]) for row in genomes.tolist()]
+
+
 def create_candiate():
     return Agent([random() for i in range(10)])
 
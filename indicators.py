@@ -0,0 +1,263 @@
+import math
+import operator
+from collections import deque
+from typing import Callable, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from candles import Candles
+
+
+def percent_change(values: np.ndarray) -> np.ndarray:
+    """Percentage difference of each value compared to the previous one"""
+    return np.diff(values) / values[:-1]
+
+
+def avg_close_price_percent_diff(candles: Candles) -> float:
+    """Calculate average absolute close price percent difference"""
+    if len(candles) < 2:
+        raise ValueError("need at least two candles")
+    return float(np.mean(np.abs(percent_change(candles.close))))
+
+
+def percent_volatility(candles: Candles) -> np.ndarray:
+    """Candle range as a percentage of the candle midpoint"""
+    return (candles.high - candles.low) / ((candles.high + candles.low) / 2)
+
+
+def avg_percent_volatility(candles: Candles) -> float:
+    """Calculate average percent volatility"""
+    if not len(candles):
+        raise ValueError("need at least one candle")
+    return float(np.mean(percent_volatility(candles)))
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each window of values, NaN until the first window is full"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        sums = np.cumsum(np.concatenate([[0], values]))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Population standard deviation of each window of values"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        windows = sliding_window_view(values, window)
+        result[window - 1:] = windows.std(axis=-1)
+    return result
+
+
+def rolling_min(values: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = sliding_window_view(values, window).min(axis=-1)
+    return result
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = sliding_window_view(values, window).max(axis=-1)
+    return result
+
+
+def rolling_volatility(candles: Candles, window: int) -> np.ndarray:
+    """Standard deviation of close-to-close returns over each window"""
+    result = np.full(len(candles), np.nan)
+    result[1:] = rolling_std(percent_change(candles.close), window)
+    return result
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """Exponential moving average with smoothing 2 / (span + 1)"""
+    return _smooth(values, 2 / (span + 1))
+
+
+def true_range(candles: Candles) -> np.ndarray:
+    prev_close = np.concatenate([candles.close[:1], candles.close[:-1]])
+    return np.maximum(candles.high, prev_close) - np.minimum(
+        candles.low, prev_close)
+
+
+def atr(candles: Candles, window: int) -> np.ndarray:
+    """Average true range, with Wilder's smoothing"""
+    return _smooth(true_range(candles), 1 / window)
+
+
+def _smooth(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponential smoothing, starting from the first value.
+    With decay d = 1 - alpha, unrolling s[j] = s[j-1] + alpha * (x[j] - s[j-1])
+    from s[-1] gives s[j] = s[-1] + d^j * cumsum(alpha * (x - s[-1]) / d^i),
+    so every step is a vectorized cumulative sum. d^-i grows without bound
+    and the sum's rounding errors with its length, so the input is split
+    into chunks of at most _CHUNK values, fewer if d^-i would pass
+    _MAX_GROWTH, each one continuing from the end of the previous one.
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.empty(len(values))
+    if not len(values):
+        return result
+    decay = 1 - alpha
+    if decay == 0:
+        result[:] = values
+        return result
+    length = min(_CHUNK, len(values),
+                 max(1, int(math.log(_MAX_GROWTH) / -math.log(decay))))
+    powers = decay**np.arange(length)
+    previous = values[0]
+    for start in range(0, len(values), length):
+        chunk = values[start:start + length]
+        n = len(chunk)
+        sums = np.cumsum(alpha * (chunk - previous) / powers[:n])
+        result[start:start + n] = previous + powers[:n] * sums
+        previous = result[start + n - 1]
+    return result
+
+
+_CHUNK = 1024
+_MAX_GROWTH = 1e150  # bound on d^-i in _smooth, far from overflowing
+
+
+class RollingMean:
+    """Incremental rolling mean, O(1) per update"""
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque[float] = deque()
+        self.total = 0.0
+
+    def update(self, value: float) -> float:
+        """Add a value, returns the mean or NaN until the window is full"""
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if len(self.values) < self.window:
+            return math.nan
+        return self.total / self.window
+
+
+class RollingStd:
+    """Incremental rolling population standard deviation, O(1) per update"""
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque[float] = deque()
+        self.shift: Optional[float] = None  # keeps the sums small
+        self.total = 0.0
+        self.squares = 0.0
+
+    def update(self, value: float) -> float:
+        if self.shift is None:
+            self.shift = value
+        shifted = value - self.shift
+        self.values.append(shifted)
+        self.total += shifted
+        self.squares += shifted * shifted
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            self.total -= old
+            self.squares -= old * old
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if len(self.values) < self.window:
+            return math.nan
+        mean = self.total / self.window
+        return math.sqrt(max(self.squares / self.window - mean * mean, 0))
+
+
+class RollingVolatility:
+    """Incremental rolling standard deviation of close-to-close returns"""
+    def __init__(self, window: int):
+        self.std = RollingStd(window)
+        self.last_close: Optional[float] = None
+
+    def update(self, candle: dict[str, float]) -> float:
+        close = candle['close']
+        if self.last_close is not None:
+            self.std.update((close - self.last_close) / self.last_close)
+        self.last_close = close
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.std.value
+
+
+class RollingExtreme:
+    """Incremental rolling min or max, amortized O(1) per update"""
+    def __init__(self, window: int, compare: Callable[[float, float], bool]):
+        self.window = window
+        self.compare = compare
+        self.count = 0
+        # (index, value) pairs, values monotonic so the front is the extreme
+        self.candidates: deque[tuple[int, float]] = deque()
+
+    def update(self, value: float) -> float:
+        while self.candidates and not self.compare(self.candidates[-1][1],
+                                                   value):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        self.count += 1
+        if self.candidates[0][0] <= self.count - 1 - self.window:
+            self.candidates.popleft()
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self.count < self.window:
+            return math.nan
+        return self.candidates[0][1]
+
+
+class RollingMin(RollingExtreme):
+    def __init__(self, window: int):
+        super().__init__(window, operator.lt)
+
+
+class RollingMax(RollingExtreme):
+    def __init__(self, window: int):
+        super().__init__(window, operator.gt)
+
+
+class EMA:
+    """Incremental exponential moving average, matches ema()"""
+    def __init__(self, span: int):
+        self.alpha = 2 / (span + 1)
+        self.value = math.nan
+
+    def update(self, value: float) -> float:
+        if math.isnan(self.value):
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class ATR:
+    """Incremental average true range, matches atr()"""
+    def __init__(self, window: int):
+        self.alpha = 1 / window
+        self.value = math.nan
+        self.last_close: Optional[float] = None
+
+    def update(self, candle: dict[str, float]) -> float:
+        prev_close = candle['close'] if self.last_close is None \
+            else self.last_close
+        true_range = max(candle['high'], prev_close) - min(
+            candle['low'], prev_close)
+        if math.isnan(self.value):
+            self.value = true_range
+        else:
+            self.value += self.alpha * (true_range - self.value)
+        self.last_close = candle['close']
+        return self.value
@@ -0,0 +1,209 @@
+"""
+Opt-in counters and latency histograms.
+Enable with enable() or by setting the INSTRUMENT environment variable.
+While disabled every hook returns after a single check, timer() hands out
+a shared no-op context and timed() leaves functions undecorated, so the
+instrumentation can stay in hot paths.
+"""
+import cProfile
+import math
+import os
+import pstats
+import threading
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, Optional, Union
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets, 4 per doubling"""
+    BUCKETS_PER_OCTAVE = 4
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: dict[int, int] = {}
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        # bucket 0 is everything under a microsecond
+        bucket = max(
+            0,
+            math.ceil(
+                math.log2(max(seconds * 1e6, 1)) * self.BUCKETS_PER_OCTAVE))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket the percentile falls in, in seconds"""
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2**(bucket / self.BUCKETS_PER_OCTAVE) / 1e6,
+                           self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()  # downloads record from many threads
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(seconds)
+
+    def report(self) -> str:
+        from tabulate import tabulate  # slow to import, rarely needed
+
+        timings = [[
+            name, h.count, f'{h.total:.3f}',
+            *(format_seconds(s)
+              for s in (h.mean, h.percentile(0.5), h.percentile(0.9),
+                        h.percentile(0.99), h.max))
+        ] for name, h in sorted(self.histograms.items())]
+        counters = sorted(self.counters.items())
+        return '\n\n'.join(
+            filter(None, [
+                tabulate(timings,
+                         headers=[
+                             'Timer', 'Count', 'Total (s)', 'Mean', 'p50',
+                             'p90', 'p99', 'Max'
+                         ]) if timings else '',
+                tabulate(counters, headers=['Counter', 'Count'])
+                if counters else ''
+            ]))
+
+
+_metrics: Optional[Metrics] = Metrics() if os.getenv('INSTRUMENT') else None
+
+
+def enable():
+    """Start recording, keeping anything recorded so far"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+
+
+def disable():
+    global _metrics
+    _metrics = None
+
+
+def enabled() -> bool:
+    return _metrics is not None
+
+
+def reset():
+    """Forget everything recorded so far"""
+    if _metrics is not None:
+        _metrics.counters.clear()
+        _metrics.histograms.clear()
+
+
+def count(name: str, n: int = 1):
+    if _metrics is not None:
+        _metrics.count(name, n)
+
+
+def record(name: str, seconds: float):
+    if _metrics is not None:
+        _metrics.record(name, seconds)
+
+
+def timed(name: str):
+    """
+    Decorator recording the latency of every call under name.
+    Functions decorated while disabled are returned as they are, so set
+    INSTRUMENT before importing the modules to time.
+    """
+    def decorator(function):
+        if _metrics is None:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _metrics is None:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.name, perf_counter() - self.start)
+
+
+_NOT_TIMED = nullcontext()
+
+
+def timer(name: str) -> AbstractContextManager[None]:
+    """Record the latency of a block under name"""
+    if _metrics is None:
+        return _NOT_TIMED
+    return _Timer(name)
+
+
+def report():
+    """Print everything recorded so far, if enabled"""
+    if _metrics is not None:
+        print(_metrics.report())
+
+
+@contextmanager
+def profile(path: Optional[Union[str, Path]] = None,
+            top: int = 20) -> Iterator[cProfile.Profile]:
+    """
+    Run a block under cProfile and print the top functions by cumulative
+    time. With path, the stats are also saved for tools like snakeviz, or
+    flameprof to render a flamegraph.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f'{seconds:.2f}s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f}ms'
+    return f'{seconds * 1e6:.1f}us'
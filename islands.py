@@ -0,0 +1,273 @@
+"""
+Island model: several GeneticAlgorithm populations evolve in separate
+processes, possibly on separate machines, and periodically send copies of
+their best agents to the next island in a ring. Migration is asynchronous,
+islands never wait for each other.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import queue
+import threading
+from multiprocessing.connection import Client, Listener
+from random import seed as seed_random
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from genetic import (Agent, ArrayGeneticAlgorithm, FitnessCache, Gene,
+                     GeneticAlgorithm, agents_to_genomes, genomes_to_agents)
+
+RESULT_POLL_INTERVAL = 1  # seconds between checks for islands that died
+
+
+class QueueTransport:
+    """Migration between local processes over multiprocessing queues"""
+    def __init__(self, islands: int):
+        self.islands = islands
+        self.inboxes = [multiprocessing.Queue() for _ in range(islands)]
+
+    def connect(self, index: int) -> QueueEndpoint:
+        return QueueEndpoint(self.inboxes[index],
+                             self.inboxes[(index + 1) % self.islands])
+
+
+class QueueEndpoint:
+    def __init__(self, inbox: multiprocessing.Queue,
+                 outbox: multiprocessing.Queue):
+        self.inbox = inbox
+        self.outbox = outbox
+
+    def send(self, migrants: np.ndarray):
+        self.outbox.put(migrants)
+
+    def receive(self) -> list[np.ndarray]:
+        """Get every batch of migrants that arrived, without waiting"""
+        arrived = []
+        while True:
+            try:
+                arrived.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        # don't hang on exit if the neighbor finished without reading
+        self.outbox.cancel_join_thread()
+
+
+class SocketTransport:
+    """
+    Migration over multiprocessing.connection sockets, so islands can run on
+    different machines. Island i listens on addresses[i] and sends to the
+    next address; every machine must be given the same addresses and authkey.
+    """
+    def __init__(self, addresses: list[tuple[str, int]], authkey: bytes):
+        self.islands = len(addresses)
+        self.addresses = addresses
+        self.authkey = authkey
+
+    @classmethod
+    def local(cls,
+              islands: int,
+              port: int,
+              authkey: bytes = b'islands') -> SocketTransport:
+        """Islands on consecutive ports of localhost"""
+        return cls([('localhost', port + i) for i in range(islands)], authkey)
+
+    def connect(self, index: int) -> SocketEndpoint:
+        return SocketEndpoint(self.addresses[index],
+                              self.addresses[(index + 1) % self.islands],
+                              self.authkey)
+
+
+class SocketEndpoint:
+    def __init__(self, address: tuple[str, int], neighbor: tuple[str, int],
+                 authkey: bytes):
+        self.listener = Listener(address, authkey=authkey)
+        self.neighbor = neighbor
+        self.authkey = authkey
+        self.connection = None
+        self.inbox: queue.Queue[np.ndarray] = queue.Queue()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def send(self, migrants: np.ndarray):
+        """
+        Send migrants to the neighbor. They are dropped if it isn't
+        listening, i.e. it hasn't started yet or has already finished.
+        """
+        try:
+            if self.connection is None:
+                self.connection = Client(self.neighbor, authkey=self.authkey)
+            self.connection.send(migrants)
+        except OSError:
+            self.connection = None
+
+    def receive(self) -> list[np.ndarray]:
+        """Get every batch of migrants that arrived, without waiting"""
+        arrived = []
+        while True:
+            try:
+                arrived.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return arrived
+
+    def close(self):
+        self.listener.close()
+        if self.connection is not None:
+            self.connection.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                return  # listener closed
+            threading.Thread(target=self._read,
+                             args=(connection, ),
+                             daemon=True).start()
+
+    def _read(self, connection):
+        with connection:
+            while True:
+                try:
+                    self.inbox.put(connection.recv())
+                except (EOFError, OSError):
+                    return
+
+
+Transport = Union[QueueTransport, SocketTransport]
+Endpoint = Union[QueueEndpoint, SocketEndpoint]
+
+
+def run_islands(fitness_function: Callable[[Agent], float],
+                genes: int,
+                islands: Optional[int] = None,
+                population: int = 50,
+                generations: int = 100,
+                interval: int = 10,
+                migrants: int = 2,
+                transport: Optional[Transport] = None,
+                indices: Optional[list[int]] = None,
+                algorithm: type[GeneticAlgorithm] = GeneticAlgorithm,
+                seed: Optional[int] = None,
+                **options) -> tuple[Agent, float]:
+    """
+    Evolve one population per island, each in its own process, and return
+    the best agent found by any of them.
+    Every interval generations, each island sends copies of its migrants best
+    agents to the next island and replaces its worst agents with the ones
+    that arrived. By default all islands run on this machine and migrate over
+    queues; to spread them over machines, give every machine the same
+    SocketTransport and the indices of the islands it should run.
+    fitness_function must be picklable, and options are passed on to
+    algorithm, e.g. evaluator=BatchEvaluator() with ArrayGeneticAlgorithm.
+    """
+    if transport is None:
+        transport = QueueTransport(islands or os.cpu_count() or 1)
+    if indices is None:
+        indices = list(range(transport.islands))
+
+    results = multiprocessing.Queue()
+    args = (transport, fitness_function, genes, population, generations,
+            interval, migrants, algorithm, seed, options)
+    processes = [
+        multiprocessing.Process(target=_island_process,
+                                args=(results, index, args),
+                                daemon=True) for index in indices
+    ]
+    for process in processes:
+        process.start()
+    try:
+        # read the results before joining, so workers can flush the queue
+        outcomes = _collect(results, dict(zip(indices, processes)))
+    except RuntimeError:
+        for process in processes:
+            process.terminate()
+        raise
+    for process in processes:
+        process.join()
+
+    errors = [outcome for outcome in outcomes if isinstance(outcome, str)]
+    if errors:
+        raise RuntimeError(f"island failed: {errors[0]}")
+    genome, score = max(outcomes, key=lambda best: best[1])
+    return Agent([Gene(value) for value in genome]), score
+
+
+def run_island(index: int, transport: Transport,
+               fitness_function: Callable[[Agent], float], genes: int,
+               population: int, generations: int, interval: int, migrants: int,
+               algorithm: type[GeneticAlgorithm], seed: Optional[int],
+               options: dict) -> tuple[list[float], float]:
+    """Evolve island index, returns the genome and score of its best agent"""
+    endpoint = transport.connect(index)
+    try:
+        # a cache makes rescoring the population for migration free
+        options.setdefault('cache', FitnessCache())
+        if seed is not None:
+            seed_random(seed + index)
+            if issubclass(algorithm, ArrayGeneticAlgorithm):
+                options.setdefault('seed', seed + index)
+        genomes = np.random.default_rng(None if seed is None else seed +
+                                        index).random((population, genes))
+        ga = algorithm(fitness_function, genomes_to_agents(genomes), **options)
+
+        for done in range(0, generations, interval):
+            ga.run(min(interval, generations - done))
+            migrate(ga, endpoint, migrants)
+
+        agent, score = ga.best
+        return [gene.value for gene in agent.genes], score
+    finally:
+        endpoint.close()
+
+
+def migrate(ga: GeneticAlgorithm, endpoint: Endpoint, migrants: int):
+    """Send copies of the best agents, replace the worst with arrivals"""
+    agents = ga.population
+    order = np.argsort(ga.evaluate(agents))  # worst first
+    genomes = agents_to_genomes(agents)
+    endpoint.send(genomes[order[-migrants:]])
+
+    arrived = endpoint.receive()
+    if arrived:
+        # keep at least half of the island's own population
+        immigrants = np.concatenate(arrived)[-(len(agents) // 2):]
+        genomes[order[:len(immigrants)]] = immigrants
+        ga.population = genomes_to_agents(genomes)
+
+
+def _collect(results: multiprocessing.Queue,
+             processes: dict[int, multiprocessing.Process]) -> list:
+    """
+    Wait for the outcome of every island, in the order of processes. An
+    island that exits without reporting one, e.g. because it was killed,
+    fails the run instead of blocking it forever.
+    """
+    outcomes = {}
+    exited = set()  # islands seen dead with no outcome, given one more poll
+    while len(outcomes) < len(processes):
+        try:
+            index, outcome = results.get(timeout=RESULT_POLL_INTERVAL)
+            outcomes[index] = outcome
+            continue
+        except queue.Empty:
+            pass
+        for index, process in processes.items():
+            if index in outcomes or process.exitcode is None:
+                continue
+            if index in exited:
+                raise RuntimeError(
+                    f"island {index} died with exit code {process.exitcode}")
+            exited.add(index)
+    return [outcomes[index] for index in processes]
+
+
+def _island_process(results: multiprocessing.Queue, index: int, args: tuple):
+    try:
+        results.put((index, run_island(index, *args)))
+    except Exception as e:
+        results.put((index, f'{index}: {e!r}'))
@@ -1,12 +1,18 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 from main import run_strategy
 from trader import Side, Trader
 from downloader import Downloader
 from strategy import Parameter, Strategy
 from decimal import Decimal
+from typing import Optional
 
 
 class JadensStategy(Strategy):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial_price: Optional[Decimal] = None  # of the live buy
+        self.sold = False
+
     def download_data(self, downloader: Downloader):
         pass
 
@@ -20,6 +26,18 @@ class JadensStategy(Strategy):
                 trader.place_market_order("ETH-USD", Side.SELL, Decimal(1))
                 break
 
+    def on_tick(self, trader: Trader, product_id: str, price: Decimal,
+                time: datetime):
+        # trade() on a live stream, checking every trade instead of hourly
+        if product_id != "ETH-USD" or self.sold:
+            return
+        if self.initial_price is None:
+            trader.place_market_order("ETH-USD", Side.BUY, Decimal(0.1))
+            self.initial_price = price
+        elif price >= self.initial_price:
+            trader.place_market_order("ETH-USD", Side.SELL, Decimal(1))
+            self.sold = True
+
 
 if __name__ == '__main__':
-    run_strategy(JadensStategy)
\ No newline at end of file
+    run_strategy(JadensStategy, end=datetime(2021, 12, 3))
\ No newline at end of file
@@ -1,33 +1,98 @@
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Callable
-
-import colorama
-from dotenv import load_dotenv
+from functools import partial
+from time import sleep
+from typing import Callable, Optional
 
 import api
+import instrument
+from backtest import EndOfData, PriceFeed
 from downloader import Downloader
 from strategy import Strategy
 from trader import TestTrader
 
 
-def run_strategy(strategy_builder: Callable[[datetime], Strategy]):
+def setup():
+    """Load the .env file and set up colored output"""
+    # imported here so importing a strategy module stays cheap
+    import colorama
+    from dotenv import load_dotenv
+
     load_dotenv()
     colorama.init()
 
-    client = api.connect()
-    time = datetime(2021, 9, 3)
+
+def run_strategy(strategy_builder: Callable[[datetime], Strategy],
+                 end: Optional[datetime] = None,
+                 profile: Optional[str] = None,
+                 start: Optional[datetime] = None):
+    """
+    Run a strategy against a TestTrader.
+    If end is given, the strategy is backtested offline on cached candles
+    until it finishes or the simulated clock reaches end, and the exchange
+    client is only loaded if candles are missing from the cache.
+    With profile, the run is profiled with cProfile and the stats are saved
+    to that path. Instrumentation is reported at the end when enabled.
+    """
+    setup()
+
+    client = api.LazyClient()
+    time = start or datetime(2021, 9, 3)
     # time = datetime.now()
     downloader = Downloader(client)
-    trader = TestTrader(client, usd=100, time=time)
+    prices = PriceFeed(time, end, downloader=downloader) if end else None
+    trader = TestTrader(client,
+                        usd=100,
+                        time=time,
+                        prices=prices,
+                        limiter=downloader.limiter)
 
     strategy: Strategy = strategy_builder(time)
+    strategy.end_time = end
+
+    with instrument.profile(profile) if profile else nullcontext():
+        print('Downloading data...')
+        strategy.download_data(downloader)
+
+        print('Trading...\n')
+        trader.show_portfolio()
+        try:
+            strategy.trade(trader)
+        except EndOfData as e:
+            print(e)
+    trader.show_portfolio()
+    instrument.report()
+
+
+def run_live(strategy_builder: Callable[[datetime], Strategy],
+             products: list[str]):
+    """
+    Run a strategy in realtime, driven by the websocket ticker feed of
+    products through Strategy.on_tick and Strategy.on_candle. The trader
+    prices and fills the streamed products from the same feed.
+    """
+    from stream import MarketStream
+
+    setup()
+
+    client = api.connect()
+    stream = MarketStream(products)
+    trader = TestTrader(client, usd=100, stream=stream)
+    strategy: Strategy = strategy_builder(datetime.now())
 
-    print('Downloading data...')
-    strategy.download_data(downloader)
+    stream.on_tick(partial(strategy.on_tick, trader))
+    stream.on_candle(partial(strategy.on_candle, trader))
 
     print('Trading...\n')
     trader.show_portfolio()
-    strategy.trade(trader)
+    stream.start()
+    try:
+        while not stream.stop:
+            sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.close()
     trader.show_portfolio()
 
 
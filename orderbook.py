@@ -0,0 +1,117 @@
+"""
+Resting limit and stop orders of the simulated exchange.
+"""
+from __future__ import annotations
+
+import heapq
+from datetime import datetime
+from itertools import count
+from typing import Iterator, Optional
+
+from orders import OrderStatus, OrderType, Side
+
+
+class Order:
+    """Order placed on the simulated exchange"""
+    def __init__(self, id: int, product_id: str, side: Side,
+                 order_type: OrderType, price: Optional[float],
+                 size: Optional[float], funds: Optional[float],
+                 time: datetime):
+        self.id = id
+        self.product_id = product_id
+        self.side = side
+        self.order_type = order_type
+        self.price = price  # limit price, or the price that triggers a stop
+        self.size = size  # amount of the asset, or
+        self.funds = funds  # amount of currency to spend when buying
+        self.time = time
+        self.status = OrderStatus.PLACED
+        self.reserved = 0  # held from the balance until the order is done
+
+    @property
+    def reserved_currency(self) -> str:
+        coin_name, curr_name = self.product_id.split('-')
+        return curr_name if self.side == Side.BUY else coin_name
+
+    def __repr__(self):
+        amount = f'size={self.size}' if self.funds is None else \
+            f'funds={self.funds}'
+        return (f'Order({self.id}, {self.product_id}, {self.side.name} '
+                f'{self.order_type.name} @ {self.price}, {amount}, '
+                f'{self.status.name})')
+
+
+class OrderBook:
+    """
+    Resting orders of one product.
+    Each kind of order is kept in a heap ordered by the price that fills it,
+    so matching a candle only looks at the orders it actually fills:
+    O(log n) per fill, O(1) per candle that fills nothing. Cancelled orders
+    are dropped lazily, when they reach the top of their heap.
+    """
+    def __init__(self):
+        # entries are (key, sequence, order), where key is the price for
+        # heaps that fill when the candle's high reaches up to the price and
+        # the negated price for those that fill when its low reaches down
+        self.buy_limits: list[tuple[float, int, Order]] = []
+        self.sell_limits: list[tuple[float, int, Order]] = []
+        self.buy_stops: list[tuple[float, int, Order]] = []
+        self.sell_stops: list[tuple[float, int, Order]] = []
+        self.orders: dict[int, Order] = {}  # open orders by id
+        self.sequence = count()  # older orders fill first at the same price
+        self.cancelled = 0
+
+    def add(self, order: Order):
+        heap, sign = self._heap(order)
+        heapq.heappush(heap,
+                       (sign * float(order.price), next(self.sequence), order))
+        self.orders[order.id] = order
+
+    def cancel(self, order: Order):
+        del self.orders[order.id]
+        order.status = OrderStatus.CANCEL
+        self.cancelled += 1
+        if self.cancelled > len(self.orders):
+            self._compact()
+
+    def match(self, open: float, high: float,
+              low: float) -> Iterator[tuple[Order, float]]:
+        """
+        Remove the orders a candle fills and yield them with their fill
+        price. A stop turns into a market order once the price trades
+        through it, and a limit order fills at its price or better; when the
+        candle opens past the price, both fill at the open. Stops go first,
+        since there's no way to tell when they triggered within the candle.
+        """
+        for heap, sign in ((self.buy_stops, 1), (self.sell_stops, -1),
+                           (self.buy_limits, -1), (self.sell_limits, 1)):
+            bound = high if sign > 0 else -low
+            while heap and heap[0][0] <= bound:
+                _, _, order = heapq.heappop(heap)
+                if self.orders.pop(order.id, None) is None:
+                    self.cancelled -= 1
+                    continue
+                price = float(order.price)
+                yield order, max(price, open) if sign > 0 else min(price, open)
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def _heap(self, order: Order) -> tuple[list, int]:
+        if order.order_type == OrderType.LIMIT:
+            if order.side == Side.BUY:
+                return self.buy_limits, -1
+            return self.sell_limits, 1
+        if order.order_type == OrderType.STOP:
+            if order.side == Side.BUY:
+                return self.buy_stops, 1
+            return self.sell_stops, -1
+        raise ValueError(f"{order.order_type.name} orders don't rest")
+
+    def _compact(self):
+        """Drop the cancelled orders once they make up most of the heaps"""
+        for heap in (self.buy_limits, self.sell_limits, self.buy_stops,
+                     self.sell_stops):
+            heap[:] = [entry for entry in heap if entry[2].id in self.orders]
+            heapq.heapify(heap)
+        self.cancelled = 0
@@ -0,0 +1,57 @@
+from datetime import datetime
+from enum import Enum
+
+from colorama import Fore
+
+
+class Side(Enum):
+    BUY = 'buy'
+    SELL = 'sell'
+
+
+class OrderType(Enum):
+    LIMIT = 'limit'
+    MARKET = 'market'
+    STOP = 'stop'
+
+
+class OrderStatus(Enum):
+    PLACED = 1
+    FILLED = 2
+    CANCEL = 3
+
+
+def format_order(coin_name: str, currency_name: str, side: Side,
+                 order_type: OrderType, order_status: OrderStatus,
+                 price: float, size: float, unit_price: float,
+                 fee_amount: float, order_time: datetime,
+                 is_real: bool) -> str:
+    """Render an order event as a colored console line"""
+    # format:
+    # [TIME] [TYPE ORDER PLACED|FILLED|CANCELLED] +- 12.34 COIN +- $12.3456 USD @ $12.3456 USD / COIN
+    l = Fore.WHITE + '['
+    r = Fore.WHITE + ']'
+
+    time = Fore.RED if is_real else Fore.WHITE
+    time += order_time.strftime('%m-%d-%y %H:%M:%S')
+
+    order = {
+        OrderStatus.PLACED: Fore.YELLOW,
+        OrderStatus.FILLED: Fore.GREEN,
+        OrderStatus.CANCEL: Fore.RED
+    }[order_status]
+    order += f'{order_type.name} ORDER {order_status.name}'
+    order = l + order + r
+
+    coin = f'{Fore.GREEN}+ ' if side == Side.BUY else f'{Fore.RED}- '
+    coin += f'{size!s:18.18} {coin_name:5.5}'
+
+    currency = f'{Fore.RED}- ' if side == Side.BUY else f'{Fore.GREEN}+ '
+    currency += f'${price!s:18.18} {currency_name:5.5}'
+
+    fee = Fore.RED if (fee_amount) else Fore.WHITE
+    fee += f'F${fee_amount:2.2f}'
+
+    unit = f'{Fore.WHITE}@ ${unit_price:.7f} {currency_name} / {coin_name}'
+
+    return f'{l}{time}{r} {order} {fee} {coin} {currency} {unit}'
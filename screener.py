@@ -0,0 +1,179 @@
+"""
+Cross-sectional screening: rank a universe of products by volatility,
+returns or volume at every point in time at once.
+"""
+from datetime import datetime
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from candles import Candles
+from utils import to_timestamp
+
+# a window length in candles, or several to compute in the same pass
+Windows = Union[int, Sequence[int]]
+
+
+class Screener:
+    """
+    Candles of many products aligned on one time grid, as (product x time)
+    matrices.
+    Coinbase has no candle when nothing traded, so gaps carry the previous
+    close forward with no range and no volume. Times before a product's
+    first candle take the close of its last candle before the grid, if data
+    has one. Without it they have no price: volatility and volume count
+    them as quiet candles, returns are NaN if their window includes them.
+    Metrics are shaped (product x time) for a single window, and
+    (window x product x time) for a sequence of windows.
+    """
+    def __init__(self,
+                 data: dict[str, Candles],
+                 granularity: int,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None):
+        """The grid covers [start, end), by default every candle in data"""
+        self.products = list(data)
+        self.granularity = granularity
+        times = [c.time for c in data.values() if len(c)]
+        if start is None or end is None:
+            if not times:
+                raise ValueError("no candles to screen")
+        first = to_timestamp(start) if start else min(t[0] for t in times)
+        last = to_timestamp(end) - 1 if end else max(t[-1] for t in times)
+        self.start = int(first) // granularity * granularity
+        self.length = max(0, (int(last) - self.start) // granularity + 1)
+
+        shape = (len(self.products), self.length)
+        self.high = np.full(shape, np.nan)
+        self.low = np.full(shape, np.nan)
+        self.close = np.full(shape, np.nan)
+        self.volume = np.zeros(shape)
+        before = np.full(len(self.products), np.nan)  # last close before
+        for row, candles in enumerate(data.values()):
+            columns = (candles.time - self.start) // granularity
+            earlier = columns < 0
+            if np.any(earlier):
+                before[row] = candles.close[earlier][-1]
+            inside = (columns >= 0) & (columns < self.length)
+            columns = columns[inside]
+            self.high[row, columns] = candles.high[inside]
+            self.low[row, columns] = candles.low[inside]
+            self.close[row, columns] = candles.close[inside]
+            self.volume[row, columns] = candles.volume[inside]
+
+        # index of the last candle at or before each column, column 0 of
+        # closes being the candle before the grid
+        traded = ~np.isnan(self.close)
+        closes = np.hstack([before[:, None], self.close])
+        last_traded = np.where(~np.isnan(closes), np.arange(self.length + 1),
+                               0)
+        np.maximum.accumulate(last_traded, axis=1, out=last_traded)
+        self.close = np.take_along_axis(closes, last_traded, axis=1)[:, 1:]
+        gaps = ~traded
+        self.high[gaps] = self.close[gaps]
+        self.low[gaps] = self.close[gaps]
+        self.listed = ~np.isnan(self.close)  # traded at or before each time
+
+    def volatility(self, windows: Windows) -> np.ndarray:
+        """
+        Mean candle range as a fraction of its midpoint, like
+        avg_percent_volatility, over the windows ending at each candle
+        """
+        spread = (self.high - self.low) / ((self.high + self.low) / 2)
+        spread[~self.listed] = 0
+        lengths = _windows(windows)[:, None, None]
+        return _shape(
+            self._unless_unlisted(
+                _rolling_sum(spread, windows) / lengths, windows), windows)
+
+    def returns(self, windows: Windows) -> np.ndarray:
+        """Close to close return over the windows ending at each candle"""
+        lengths = _windows(windows)
+        previous = np.arange(self.length) - lengths[:, None]
+        before = self.close[:, np.maximum(previous, 0)]
+        result = self.close[:, None, :] / before - 1
+        result[:, previous < 0] = np.nan
+        return _shape(result.swapaxes(0, 1), windows)
+
+    def dollar_volume(self, windows: Windows) -> np.ndarray:
+        """Volume traded in USD over the windows ending at each candle"""
+        dollars = np.where(self.listed, self.volume * self.close, 0)
+        return _shape(
+            self._unless_unlisted(_rolling_sum(dollars, windows), windows),
+            windows)
+
+    def _unless_unlisted(self, result: np.ndarray,
+                         windows: Windows) -> np.ndarray:
+        """NaN where a product didn't trade at all within the window"""
+        listed = _rolling_sum(self.listed.astype(float), windows)
+        result[listed == 0] = np.nan
+        return result
+
+    def top(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Rows of the k products with the highest scores at each time, best
+        first, for scores shaped like the metrics. NaN scores rank last.
+        """
+        k = min(k, len(self.products))
+        scores = np.where(np.isnan(scores), -np.inf, scores)
+        best = np.argpartition(-scores, k - 1, axis=-2)[..., :k, :]
+        order = np.argsort(-np.take_along_axis(scores, best, axis=-2),
+                           axis=-2,
+                           kind='stable')
+        return np.take_along_axis(best, order, axis=-2)
+
+    def rank(self, scores: np.ndarray, k: int,
+             time: datetime) -> list[tuple[str, float]]:
+        """
+        The k best products by a (product x time) metric, from the candles
+        that closed by time, best first. Products without a score are left
+        out.
+        """
+        column = self.column(time)
+        rows = self.top(scores[:, column:column + 1], k)[:, 0]
+        return [(self.products[row], float(scores[row, column]))
+                for row in rows if not np.isnan(scores[row, column])]
+
+    def column(self, time: datetime) -> int:
+        """Column of the last candle that closed by time"""
+        column = (to_timestamp(time) - self.start) // self.granularity - 1
+        if not 0 <= column < self.length:
+            raise ValueError(f"{time} is outside of the screened candles")
+        return column
+
+
+def _windows(windows: Windows) -> np.ndarray:
+    lengths = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    if lengths.ndim != 1 or np.any(lengths < 1):
+        raise ValueError("windows must be positive lengths")
+    return lengths
+
+
+def _shape(result: np.ndarray, windows: Windows) -> np.ndarray:
+    """Drop the window axis if a single window was asked for"""
+    return result[0] if np.ndim(windows) == 0 else result
+
+
+def _rolling_sum(values: np.ndarray, windows: Windows) -> np.ndarray:
+    """
+    Sums over each trailing window of the rows of values, shaped
+    (window x row x column). NaN until the window is full, or if it
+    includes a NaN.
+    """
+    lengths = _windows(windows)
+    rows, columns = values.shape
+    missing = np.isnan(values)
+    # prefix sums, one cumsum for every window
+    sums = np.zeros((rows, columns + 1))
+    np.cumsum(np.where(missing, 0, values), axis=1, out=sums[:, 1:])
+    gaps = np.zeros((rows, columns + 1), dtype=np.int64)
+    np.cumsum(missing, axis=1, out=gaps[:, 1:])
+
+    ends = np.broadcast_to(np.arange(1, columns + 1), (len(lengths), columns))
+    starts = ends - lengths[:, None]
+    full = starts >= 0
+    starts = np.maximum(starts, 0)
+    result = sums[:, ends] - sums[:, starts]
+    result[gaps[:, ends] - gaps[:, starts] > 0] = np.nan
+    result[:, ~full] = np.nan
+    return result.swapaxes(0, 1)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from candles import CANDLE_DTYPE, Candles
+
+# (product_id, granularity) -> (offset, length, start, end) of a series
+Index = dict[tuple[str, int], tuple[int, int, int, int]]
+# (product_id, granularity) -> (start, end, candles) of a series
+Series = dict[tuple[str, int], tuple[int, int, Candles]]
+
+
+class SharedCandles:
+    """
+    Candle series published in a single shared memory block.
+    The publishing process owns the block; worker processes attach to it by
+    name (pickling a SharedCandles sends only the name and index) and read the
+    candles as zero-copy views, so a dataset is downloaded and held in memory
+    once no matter how many processes use it.
+    """
+    def __init__(self, memory: SharedMemory, index: Index, owner: bool):
+        self.memory = memory
+        self.index = index
+        self.owner = owner
+        records = sum(length for _, length, _, _ in index.values())
+        self.data = np.ndarray(records, dtype=CANDLE_DTYPE, buffer=memory.buf)
+        if not owner:
+            self.data.flags.writeable = False  # other processes read it too
+
+    @classmethod
+    def publish(cls, series: Series) -> SharedCandles:
+        """
+        Copy series into a new shared memory block.
+        series maps (product_id, granularity) to the [start, end) timestamps
+        that were downloaded and the candles in that range.
+        """
+        index: Index = {}
+        offset = 0
+        for key, (start, end, candles) in series.items():
+            index[key] = (offset, len(candles), start, end)
+            offset += len(candles)
+        # SharedMemory can't be empty
+        size = max(offset * CANDLE_DTYPE.itemsize, 1)
+        shared = cls(SharedMemory(create=True, size=size), index, owner=True)
+        for key, (_, _, candles) in series.items():
+            offset, length, _, _ = index[key]
+            shared.data[offset:offset + length] = candles.data
+        return shared
+
+    @classmethod
+    def attach(cls, name: str, index: Index) -> SharedCandles:
+        """Open a block published by another process"""
+        memory = SharedMemory(name=name)
+        # only the owner should unlink the block, stop the resource tracker
+        # from destroying it when this process exits
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        return cls(memory, index, owner=False)
+
+    def covers(self, product_id: str, granularity: int, start: int,
+               end: int) -> bool:
+        """Check if the range [start, end) was published"""
+        entry = self.index.get((product_id, granularity))
+        return entry is not None and entry[2] <= start and end <= entry[3]
+
+    def get(self,
+            product_id: str,
+            granularity: int,
+            start: Optional[int] = None,
+            end: Optional[int] = None) -> Candles:
+        """Get a view of the published candles with start <= time < end"""
+        offset, length, covered_start, covered_end = self.index[(product_id,
+                                                                 granularity)]
+        series = self.data[offset:offset + length]
+        lo, hi = np.searchsorted(series['time'], [
+            covered_start if start is None else start,
+            covered_end if end is None else end
+        ])
+        return Candles(series[lo:hi])
+
+    def close(self):
+        """Detach from the block, and free it if this process published it"""
+        self.data = None  # views must be released before closing
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __reduce__(self):
+        return SharedCandles.attach, (self.memory.name, self.index)
+
+    def __enter__(self) -> SharedCandles:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,14 +1,16 @@
 from collections import OrderedDict
-from datetime import datetime, timedelta
+from datetime import datetime
+from decimal import Decimal
 import math
 from trader import Trader
 from downloader import Downloader
-from symbol import parameters
 from genetic import Agent, Gene
-import statistics
 from typing import Optional
 
-from cbpro import AuthenticatedClient as CBProClient
+import numpy as np
+
+import indicators
+from candles import Candles
 
 
 class Parameter:
@@ -31,17 +33,33 @@ class Parameter:
         """Get the value of the parameter"""
         return self.min + self.value * (self.max - self.min)
 
+    def set_value(self, value: float):
+        """Set the value of the parameter, the inverse of get_value()"""
+        self.value = (value - self.min) / (self.max - self.min)
+
+    def get_values(self, genes: np.ndarray) -> np.ndarray:
+        """Vectorized get_value() for an array of gene values"""
+        return self.min + genes * (self.max - self.min)
+
 
 class IntParameter(Parameter):
     """Strategy parameter where output is an integer in the range [min_value, max_value)"""
     def get_value(self) -> int:
         return int(super().get_value())
 
+    def get_values(self, genes: np.ndarray) -> np.ndarray:
+        return np.trunc(super().get_values(genes)).astype(np.int64)
+
 
 class Strategy:
     def __init__(self, start_time: Optional[datetime] = None):
         self.start_time = start_time or datetime.now()
         self.parameters: OrderedDict[str, Parameter] = {}
+        # products the strategy is restricted to, when set by a backtest
+        # runner; strategies that pick their own products only pick these
+        self.universe: Optional[list[str]] = None
+        # when the backtest stops, if the strategy is backtested
+        self.end_time: Optional[datetime] = None
 
     def download_data(self, downloader: Downloader):
         raise NotImplementedError
@@ -49,34 +67,79 @@ class Strategy:
     def trade(self, trader: Trader):
         raise NotImplementedError
 
+    def on_tick(self, trader: Trader, product_id: str, price: Decimal,
+                time: datetime):
+        """Called on every trade when running on a live market stream"""
+
+    def on_candle(self, trader: Trader, product_id: str,
+                  candle: dict[str, float]):
+        """Called whenever a candle closes when running on a live stream"""
+
     def create_agent_from_parameters(self) -> Agent:
         return Agent([Gene(param.value) for param in self.parameters.values()])
 
     def update_parameters_from_agent(self, agent: Agent):
-        for (gene, param) in zip(agent.genes, parameters.values()):
+        for (gene, param) in zip(agent.genes, self.parameters.values()):
             param.value = gene.value
-    
+
     def print_parameters(self):
-        for name, param in parameters.items():
+        for name, param in self.parameters.items():
             print(f'{name:10.10}: {param.value}')
 
-    def avg_close_price_percent_diff(
-            self, historical_data: list[dict[str, float]]) -> float:
+    def parameters_from_genomes(self,
+                                genomes: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Map an (agents x genes) array, as used by genetic.BatchEvaluator, to
+        an array of values per parameter with one value per agent.
+        """
+        return {
+            name: param.get_values(genomes[:, i])
+            for i, (name, param) in enumerate(self.parameters.items())
+        }
+
+    def backtest_batch(self, parameters: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Simulate the strategy for many parameter sets at once, on the data
+        from download_data, and return the final portfolio value of each.
+        """
+        raise NotImplementedError
+
+    def batch_fitness(self, genomes: np.ndarray) -> np.ndarray:
+        """Fitness function for genetic.BatchEvaluator"""
+        return self.backtest_batch(self.parameters_from_genomes(genomes))
+
+    def avg_close_price_percent_diff(self, historical_data: Candles) -> float:
         """Calculate average close price percent difference"""
-        prices = [p['close'] for p in historical_data]
-        # calculate percentage difference of each closing price compared to last
-        percent_change = [
-            abs((value - benchmark) / benchmark)
-            for benchmark, value in zip(prices, prices[1:])
-        ]
-        # calculate average percent difference
-        return statistics.mean(percent_change)
-
-    def avg_percent_volatility(
-            self, historical_data: list[dict[str, float]]) -> float:
+        return indicators.avg_close_price_percent_diff(historical_data)
+
+    def avg_percent_volatility(self, historical_data: Candles) -> float:
         """Calculate average percent volatility"""
-        percent_volatility = [
-            (p['high'] - p['low']) / ((p['high'] + p['low'] / 2))
-            for p in historical_data
-        ]
-        return statistics.mean(percent_volatility)
+        return indicators.avg_percent_volatility(historical_data)
+
+    def rolling_mean(self, values: np.ndarray, window: int) -> np.ndarray:
+        """
+        Rolling mean over a whole array, for stepwise use update a
+        RollingMean once per candle instead
+        """
+        return indicators.rolling_mean(values, window)
+
+    def rolling_volatility(self, historical_data: Candles,
+                           window: int) -> np.ndarray:
+        """Rolling volatility of close-to-close returns"""
+        return indicators.rolling_volatility(historical_data, window)
+
+    def rolling_min(self, values: np.ndarray, window: int) -> np.ndarray:
+        """Rolling minimum over a whole array, see RollingMin"""
+        return indicators.rolling_min(values, window)
+
+    def rolling_max(self, values: np.ndarray, window: int) -> np.ndarray:
+        """Rolling maximum over a whole array, see RollingMax"""
+        return indicators.rolling_max(values, window)
+
+    def ema(self, values: np.ndarray, span: int) -> np.ndarray:
+        """Exponential moving average over a whole array, see EMA"""
+        return indicators.ema(values, span)
+
+    def atr(self, historical_data: Candles, window: int) -> np.ndarray:
+        """Average true range over all candles, see ATR"""
+        return indicators.atr(historical_data, window)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from cbpro import WebsocketClient
+
+from candles import Candles
+from utils import to_timestamp
+
+TickCallback = Callable[[str, Decimal, datetime], None]
+CandleCallback = Callable[[str, dict[str, float]], None]
+
+
+class CandleAggregator:
+    """Builds candles of a fixed granularity from a stream of trades"""
+    def __init__(self, granularity: int = 60, history: int = 1440):
+        self.granularity = granularity
+        self.current: Optional[list[float]] = None  # CANDLE_DTYPE order
+        self.completed: deque[tuple[float, ...]] = deque(maxlen=history)
+
+    def add(self, time: datetime, price: float,
+            size: float) -> Optional[dict[str, float]]:
+        """Add a trade, returns the previous candle if this one closed it"""
+        bucket = to_timestamp(time) // self.granularity * self.granularity
+        closed = None
+        if self.current is not None and bucket < self.current[0]:
+            return None  # late message for a candle that already closed
+        if self.current is not None and bucket > self.current[0]:
+            closed = tuple(self.current)
+            self.completed.append(closed)
+            self.current = None
+
+        if self.current is None:
+            self.current = [bucket, price, price, price, price, size]
+        else:
+            self.current[1] = min(self.current[1], price)  # low
+            self.current[2] = max(self.current[2], price)  # high
+            self.current[4] = price  # close
+            self.current[5] += size  # volume
+
+        if closed is None:
+            return None
+        return dict(zip(('time', 'low', 'high', 'open', 'close', 'volume'),
+                        closed))
+
+    def candles(self) -> Candles:
+        """Get the completed candles"""
+        return Candles.from_rows(self.completed)
+
+
+class MarketStream(WebsocketClient):
+    """
+    Realtime trade feed from the Coinbase websocket.
+    Subscribes to matches, which carry every trade, and to the ticker; a
+    trade seen on both is only counted once. Keeps the last price and
+    candles of each product locally and calls the registered callbacks on
+    the websocket thread, so they should return quickly.
+    """
+    URL = 'wss://ws-feed.pro.coinbase.com'
+
+    def __init__(self,
+                 products: list[str],
+                 granularity: int = 60,
+                 url: str = URL,
+                 record: Optional[Path] = None):
+        super().__init__(url=url,
+                         products=products,
+                         channels=['ticker', 'matches'],
+                         should_print=False)
+        self.granularity = granularity
+        self.last_price: dict[str, Decimal] = {}
+        self.last_trade: dict[str, int] = {}  # trade ids only increase
+        self.aggregators: dict[str, CandleAggregator] = {}
+        self.tick_callbacks: list[TickCallback] = []
+        self.candle_callbacks: list[CandleCallback] = []
+        self.record = open(record, 'a') if record else None
+
+    def on_tick(self, callback: TickCallback):
+        """Call callback(product_id, price, time) on every trade"""
+        self.tick_callbacks.append(callback)
+
+    def on_candle(self, callback: CandleCallback):
+        """Call callback(product_id, candle) whenever a candle closes"""
+        self.candle_callbacks.append(callback)
+
+    def price(self, product_id: str) -> Decimal:
+        """Get the last traded price of a product"""
+        if product_id not in self.last_price:
+            raise ValueError(f"no {product_id} ticker received yet")
+        return self.last_price[product_id]
+
+    def candles(self, product_id: str) -> Candles:
+        """Get the candles completed since the stream started"""
+        if product_id not in self.aggregators:
+            return Candles()
+        return self.aggregators[product_id].candles()
+
+    def on_message(self, msg: dict):
+        if self.record:
+            self.record.write(json.dumps(msg) + '\n')
+        if msg.get('type') not in ('ticker', 'match') or 'time' not in msg:
+            return  # subscriptions, heartbeats, ...
+
+        product_id = msg['product_id']
+        trade_id = msg.get('trade_id')
+        if trade_id is not None:
+            if trade_id <= self.last_trade.get(product_id, -1):
+                return  # already seen on the other channel
+            self.last_trade[product_id] = trade_id
+        price = Decimal(msg['price'])
+        time = parse_time(msg['time'])
+        size = float(msg.get('last_size') or msg.get('size') or 0)
+        self.last_price[product_id] = price
+
+        for callback in self.tick_callbacks:
+            callback(product_id, price, time)
+
+        if product_id not in self.aggregators:
+            self.aggregators[product_id] = CandleAggregator(self.granularity)
+        candle = self.aggregators[product_id].add(time, float(price), size)
+        if candle is not None:
+            for callback in self.candle_callbacks:
+                callback(product_id, candle)
+
+    def on_close(self):
+        if self.record:
+            self.record.close()
+
+
+class ReplayStream(MarketStream):
+    """
+    Stand-in for MarketStream that replays recorded messages, or a file
+    written with MarketStream(record=...), without touching the network.
+    """
+    def __init__(self,
+                 messages: Union[Iterable[dict], Path],
+                 granularity: int = 60):
+        super().__init__(products=[], granularity=granularity)
+        self.messages = messages
+
+    @classmethod
+    def from_file(cls, path: Path, granularity: int = 60) -> ReplayStream:
+        """Replay a recording, which is read as it is replayed"""
+        return cls(Path(path), granularity)
+
+    def start(self):
+        """Feed every message through the callbacks, then stop"""
+        self.stop = False
+        with ExitStack() as stack:
+            messages = self.messages
+            if isinstance(messages, Path):
+                messages = map(json.loads, stack.enter_context(open(messages)))
+            for msg in messages:
+                if self.stop:
+                    break
+                self.on_message(msg)
+        self.stop = True
+
+    def close(self):
+        self.stop = True
+
+
+def parse_time(time: str) -> datetime:
+    """Parse a websocket timestamp into a naive UTC datetime"""
+    return datetime.fromisoformat(time.rstrip('Z').split('+')[0])
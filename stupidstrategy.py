@@ -1,20 +1,32 @@
 from datetime import timedelta
 from main import run_strategy
-from trader import Side, Trader
+from trader import Side, TestTrader, Trader
 from downloader import Downloader
 from strategy import Parameter, Strategy
+from typing import Optional
+
+import numpy as np
+
+from candles import Candles
+from utils import to_timestamp
 
 
 class StupidStrategy(Strategy):
     """Example strategy that buys an asset and sells it after a certain period of time"""
     ASSET = 'DOGE-USD'  # trade DOGE
+    USD = 100  # starting balance of run_strategy
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.parameters['sell_delay_seconds'] = Parameter(60 * 60 * 24, 30, 60 * 60 * 24)
+        self.parameters['sell_delay_seconds'] = Parameter(
+            60 * 60 * 24, 30, 60 * 60 * 24)
+        self.downloader: Optional[Downloader] = None
+        self.candles: Optional[Candles] = None
 
     def download_data(self, downloader: Downloader):
-        pass
+        # trade() gets its prices from the trader, only backtest_batch needs
+        # candles, so they are downloaded the first time it runs
+        self.downloader = downloader
 
     def trade(self, trader: Trader):
         trader.place_market_order(self.ASSET, Side.BUY)  # buy all
@@ -22,6 +34,36 @@ class StupidStrategy(Strategy):
         trader.wait(timedelta(seconds=wait_time_seconds))
         trader.place_market_order(self.ASSET, Side.SELL)  # sell all
 
+    def batch_candles(self) -> Candles:
+        """Candles for the longest possible sell delay, downloaded once"""
+        if self.candles is None:
+            if self.downloader is None:
+                raise RuntimeError(
+                    "call download_data() before backtest_batch()")
+            max_delay = self.parameters['sell_delay_seconds'].max
+            self.candles = self.downloader.historical_data(
+                self.ASSET,
+                self.start_time,
+                self.start_time + timedelta(seconds=max_delay),
+                granularity=60)
+        return self.candles
+
+    def backtest_batch(self, parameters: dict[str, np.ndarray]) -> np.ndarray:
+        """What trade() ends up with on a TestTrader, for every sell delay"""
+        candles = self.batch_candles()
+        start = to_timestamp(self.start_time)
+        delays = parameters['sell_delay_seconds']
+        # TestTrader fills at the close of the last candle at or before now
+        buy = np.searchsorted(candles.time, start, side='right') - 1
+        if buy < 0:
+            raise ValueError(
+                f"no {self.ASSET} price data before {self.start_time}")
+        sell = np.searchsorted(candles.time, start + delays, side='right') - 1
+        # buying pays the fee on top, selling pays it out of the proceeds
+        fee = float(TestTrader.COINBASE_FEE)
+        return (self.USD / (1 + fee) * candles.close[sell] /
+                candles.close[buy] * (1 - fee))
+
 
 if __name__ == '__main__':
-    run_strategy(StupidStrategy)
\ No newline at end of file
+    run_strategy(StupidStrategy)
@@ -0,0 +1,70 @@
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backtest import PriceFeed
+from candles import CANDLE_DTYPE, Candles
+from stupidstrategy import StupidStrategy
+import trader
+from utils import to_timestamp
+
+START = datetime(2021, 9, 3)
+FEE = float(trader.TestTrader.COINBASE_FEE)
+
+
+def random_candles(n: int, seed: int = 0) -> Candles:
+    """n 1 minute candles from START, following a random walk"""
+    rng = np.random.default_rng(seed)
+    data = np.zeros(n, dtype=CANDLE_DTYPE)
+    data['time'] = to_timestamp(START) + 60 * np.arange(n)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    data['open'] = data['high'] = data['low'] = data['close'] = close
+    return Candles(data)
+
+
+def simulated(candles: Candles, minutes: int) -> trader.TestTrader:
+    prices = PriceFeed(START, START + timedelta(minutes=minutes))
+    prices.add(StupidStrategy.ASSET, candles)
+    return trader.TestTrader(None,
+                             StupidStrategy.USD,
+                             time=START,
+                             log=False,
+                             prices=prices,
+                             fast=True)
+
+
+class StubDownloader:
+    def __init__(self, candles: Candles):
+        self.candles = candles
+
+    def historical_data(self, product_id, start, end, granularity):
+        return self.candles
+
+
+def test_batch_backtest_matches_trade():
+    candles = random_candles(60 * 24 + 1)
+    strategy = StupidStrategy(START)
+    strategy.download_data(StubDownloader(candles))
+    delays = np.array([30, 60, 61, 90.5, 3600, 5000.7, 60 * 60 * 24])
+
+    batch = strategy.backtest_batch({'sell_delay_seconds': delays})
+    for delay, value in zip(delays, batch):
+        strategy.parameters['sell_delay_seconds'].set_value(delay)
+        t = simulated(candles, 60 * 24 + 1)
+        strategy.trade(t)
+        assert math.isclose(value, t.balance['USD'])
+
+
+def test_batch_backtest_needs_price_before_start():
+    strategy = StupidStrategy(START - timedelta(minutes=1))
+    strategy.download_data(StubDownloader(random_candles(10)))
+    with pytest.raises(ValueError):
+        strategy.backtest_batch({'sell_delay_seconds': np.array([60])})
+
+
+def test_batch_backtest_needs_downloaded_data():
+    with pytest.raises(RuntimeError):
+        StupidStrategy(START).backtest_batch(
+            {'sell_delay_seconds': np.array([60])})
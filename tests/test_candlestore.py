@@ -0,0 +1,71 @@
+import os
+import weakref
+
+import numpy as np
+
+from candles import CANDLE_DTYPE
+from candlestore import CandleStore
+
+START = 1630627200  # 2021-09-03
+GRANULARITY = 60
+
+
+def candles(n: int) -> np.ndarray:
+    data = np.zeros(n, dtype=CANDLE_DTYPE)
+    data['time'] = START + GRANULARITY * np.arange(n)
+    data['close'] = 100
+    return data
+
+
+def fill(store: CandleStore, product_id: str, n: int = 100):
+    store.insert(product_id, GRANULARITY, START, START + n * GRANULARITY,
+                 candles(n))
+
+
+def test_evicts_the_least_recently_loaded_series(tmp_path):
+    store = CandleStore(tmp_path, size_limit=None)
+    for age, product_id in enumerate(['A-USD', 'B-USD', 'C-USD']):
+        fill(store, product_id)
+        old = 1000 * (3 - age)
+        os.utime(tmp_path / f'{product_id}-{GRANULARITY}',
+                 (START - old, START - old))
+    CandleStore(tmp_path).get('A-USD', GRANULARITY, START, START + 60)
+
+    series_size = 100 * CANDLE_DTYPE.itemsize + 16  # plus its coverage
+    store.size_limit = 2 * series_size
+    assert store.evict() == series_size
+    assert not (tmp_path / f'B-USD-{GRANULARITY}').exists()
+    assert store.missing('B-USD', GRANULARITY, START,
+                         START + 60) == [(START, START + 60)]
+    assert len(store.get('A-USD', GRANULARITY, START, START + 6000)) == 100
+    assert store.evict() == 0
+
+
+def test_series_being_written_are_not_evicted(tmp_path):
+    store = CandleStore(tmp_path, size_limit=0)
+    fill(store, 'A-USD')
+    fill(store, 'B-USD')
+    with store.lock('A-USD', GRANULARITY):
+        store.evict()
+    assert (tmp_path / f'A-USD-{GRANULARITY}').exists()
+    assert not (tmp_path / f'B-USD-{GRANULARITY}').exists()
+
+
+def test_backfills_unmap_the_series_before_rewriting(tmp_path, monkeypatch):
+    store = CandleStore(tmp_path, size_limit=None)
+    store.insert('A-USD', GRANULARITY, START + 50 * GRANULARITY,
+                 START + 100 * GRANULARITY,
+                 candles(100)[50:])
+    mapped = weakref.ref(store._load_series('A-USD', GRANULARITY))
+    assert isinstance(mapped(), np.memmap)
+
+    replace = os.replace
+
+    def check_unmapped(src, dst):
+        if str(dst).endswith('candles.bin'):
+            assert mapped() is None  # Windows can't replace a mapped file
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', check_unmapped)
+    fill(store, 'A-USD')
+    assert len(store.get('A-USD', GRANULARITY, START, START + 6000)) == 100
@@ -0,0 +1,154 @@
+import threading
+from decimal import Decimal
+from itertools import count
+from typing import Optional
+
+import pytest
+
+from orders import Side
+import trader
+from utils import RateLimiter
+
+FEE = Decimal('0.005')
+
+
+class MockExchange:
+    """
+    Stands in for cbpro's AuthenticatedClient. Orders stay open until
+    settled with fill() or reject(), and get_order fails while broken.
+    """
+    def __init__(self, usd: str = '100'):
+        self.accounts = {'USD': usd, 'BTC': '0'}
+        self.orders: dict[str, dict] = {}
+        self.ids = count(1)
+        self.broken = False
+        self.placed = threading.Condition()
+
+    def get_accounts(self) -> list[dict]:
+        return [{
+            'currency': currency,
+            'available': available
+        } for currency, available in self.accounts.items()]
+
+    def get_products(self) -> list[dict]:
+        return [{
+            'id': 'BTC-USD',
+            'base_increment': '0.00000001',
+            'quote_increment': '0.01'
+        }]
+
+    def place_market_order(self,
+                           product_id: str,
+                           side: str,
+                           size: Optional[str] = None,
+                           funds: Optional[str] = None) -> dict:
+        with self.placed:
+            id = str(next(self.ids))
+            self.orders[id] = {
+                'id': id,
+                'side': side,
+                'size': size,
+                'funds': funds,
+                'status': 'pending'
+            }
+            self.placed.notify_all()
+        return self.orders[id]
+
+    def wait_placed(self, id: str):
+        """Wait for the trader's sender thread to place an order"""
+        with self.placed:
+            assert self.placed.wait_for(lambda: id in self.orders, timeout=5)
+
+    def get_order(self, id: str) -> dict:
+        if self.broken or id not in self.orders:
+            return {'message': 'NotFound'}
+        return dict(self.orders[id])
+
+    def fill(self, id: str, unit_price: Decimal, part: Decimal = Decimal(1)):
+        self.wait_placed(id)
+        order = self.orders[id]
+        if order['funds'] is not None:  # the fee comes out of the funds
+            spent = Decimal(order['funds']) * part
+            value = spent / (1 + FEE)
+            fee = spent - value
+            size = value / unit_price
+        else:
+            size = Decimal(order['size']) * part
+            value = size * unit_price
+            fee = value * FEE
+        order.update(status='done',
+                     filled_size=str(size),
+                     executed_value=str(value),
+                     fill_fees=str(fee))
+
+    def reject(self, id: str):
+        self.wait_placed(id)
+        self.orders[id].update(status='rejected', reject_reason='post only')
+
+
+@pytest.fixture
+def exchange(monkeypatch) -> MockExchange:
+    monkeypatch.setattr(trader.CoinbaseTrader, 'FILL_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(trader.CoinbaseTrader, 'MAX_FAILED_POLLS', 3)
+    return MockExchange()
+
+
+def coinbase(exchange: MockExchange) -> trader.CoinbaseTrader:
+    return trader.CoinbaseTrader(exchange,
+                                 log=False,
+                                 limiter=RateLimiter(10000))
+
+
+def test_fills_settle_the_ledger(exchange):
+    t = coinbase(exchange)
+    buy = t.place_market_order('BTC-USD', Side.BUY)
+    assert t.balance['USD'] == 0
+    assert t.holdings()['USD'] == 100  # still ours until it fills
+
+    exchange.fill('1', Decimal(50))
+    buy.result(timeout=5)
+    assert t.balance['USD'] == 0
+    assert t.balance['BTC'] == 100 / (1 + FEE) / 50
+    assert not t.reserved['USD']
+
+    sell = t.place_market_order('BTC-USD', Side.SELL)
+    exchange.wait_placed('2')
+    sold = Decimal(exchange.orders['2']['size'])
+    exchange.fill('2', Decimal(60))
+    sell.result(timeout=5)
+    assert t.balance['BTC'] < Decimal('1e-8')  # dust below the increment
+    assert t.balance['USD'] == sold * 60 * (1 - FEE)
+    t.close()
+
+
+def test_partial_fills_refund_the_rest(exchange):
+    t = coinbase(exchange)
+    buy = t.place_market_order('BTC-USD', Side.BUY, Decimal('0.5'))
+    exchange.fill('1', Decimal(50), part=Decimal('0.4'))
+    buy.result(timeout=5)
+    assert t.balance['BTC'] == 50 / (1 + FEE) * Decimal('0.4') / 50
+    assert t.balance['USD'] == 100 - 50 * Decimal('0.4')
+    assert t.holdings() == t.balance
+    t.close()
+
+
+def test_rejected_orders_fail_and_return_their_funds(exchange):
+    t = coinbase(exchange)
+    buy = t.place_market_order('BTC-USD', Side.BUY)
+    exchange.reject('1')
+    with pytest.raises(RuntimeError, match='rejected'):
+        buy.result(timeout=5)
+    assert t.balance['USD'] == 100
+    assert not t.reserved['USD']
+    t.close()
+
+
+def test_orders_that_cant_be_polled_are_given_up_on(exchange):
+    t = coinbase(exchange)
+    exchange.broken = True
+    buy = t.place_market_order('BTC-USD', Side.BUY)
+    with pytest.raises(RuntimeError, match='NotFound'):
+        buy.result(timeout=5)
+    assert t.balance['USD'] == 100
+    assert not t.pending
+    t.close()  # doesn't wait on the order forever
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+from benchmark import FakeClient
+from candlestore import CandleStore
+from downloader import Downloader
+from utils import RateLimiter
+
+START = datetime(2021, 9, 3)
+END = START + timedelta(hours=10)
+
+
+def test_eviction_never_drops_what_was_just_downloaded(tmp_path):
+    store = CandleStore(tmp_path, size_limit=1)  # smaller than any download
+    downloader = Downloader(FakeClient(), store, limiter=RateLimiter(10**9))
+
+    first = downloader.backfill_many(['A-USD', 'B-USD'], START, END, 60)
+    assert [len(candles) for candles in first.values()] == [600, 600]
+    assert (tmp_path / 'A-USD-60').exists()
+
+    second = downloader.backfill('C-USD', START, END, 60)
+    assert len(second) == 600
+    assert (tmp_path / 'C-USD-60').exists()
+    assert not (tmp_path / 'A-USD-60').exists()
+    assert not (tmp_path / 'B-USD-60').exists()
@@ -0,0 +1,55 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from eventlog import OrderEventLog, read_events
+from orders import OrderStatus, OrderType, Side
+
+TIME = datetime(2021, 9, 3)
+
+
+def record(log: OrderEventLog, price: float):
+    log.record('BTC', 'USD', Side.BUY, OrderType.MARKET, OrderStatus.FILLED,
+               price, 1, price, 0, TIME, False)
+
+
+def record_many(log: OrderEventLog, first: float):
+    for price in range(first, first + 500):
+        record(log, price)
+
+
+def test_events_from_several_threads_are_all_written(tmp_path):
+    path = tmp_path / 'events.bin'
+    seen = []
+    with OrderEventLog(path, [lambda batch: seen.append(batch.copy())],
+                       batch_size=16,
+                       batches=2) as log:
+        threads = [
+            threading.Thread(target=record_many, args=(log, 1000 * i))
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    expected = [1000 * i + j for i in range(4) for j in range(500)]
+    events = read_events(path)
+    assert sorted(events['price']) == expected
+    assert sorted(np.concatenate(seen)['price']) == expected
+    assert events[0]['coin'] == b'BTC'
+
+
+def test_a_failing_consumer_does_not_stall_the_log(capsys):
+    def broken(batch):
+        raise ValueError('broken consumer')
+
+    seen = []
+    with OrderEventLog(consumers=[broken, seen.append],
+                       batch_size=2,
+                       batches=2) as log:
+        for price in range(10):  # more batches than the ring holds
+            record(log, price)
+    assert sum(len(batch) for batch in seen) == 10
+    assert 'broken consumer' in capsys.readouterr().err
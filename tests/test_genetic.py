@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from genetic import (Agent, ArrayGeneticAlgorithm, BatchEvaluator, Gene,
+                     GeneticAlgorithm)
+
+TARGET = np.linspace(0, 1, 5)
+
+
+def batch_fitness(genomes: np.ndarray) -> np.ndarray:
+    return -np.sum((genomes - TARGET)**2, axis=1)
+
+
+def test_array_algorithm_scores_genomes_directly():
+    calls = []
+
+    def fitness(genomes: np.ndarray) -> np.ndarray:
+        calls.append(genomes.copy())
+        return batch_fitness(genomes)
+
+    genomes = np.random.default_rng(0).random((20, len(TARGET)))
+    ga = ArrayGeneticAlgorithm(fitness,
+                               genomes,
+                               evaluator=BatchEvaluator(),
+                               seed=0)
+    agent, score = ga.run(3)
+
+    assert len(calls) == 3  # one batch per generation
+    scores = np.concatenate([batch_fitness(g) for g in calls])
+    assert score == scores.max()
+    genome = np.concatenate(calls)[np.argmax(scores)]
+    assert [gene.value for gene in agent.genes] == genome.tolist()
+
+
+def population(size: int = 4) -> list[Agent]:
+    return [Agent([Gene(0.5) for _ in TARGET]) for _ in range(size)]
+
+
+def test_interrupted_runs_save_a_checkpoint(tmp_path):
+    evaluations = 0
+
+    def fitness(agent: Agent) -> float:
+        nonlocal evaluations
+        evaluations += 1
+        if evaluations > 2 * 4:  # during the third generation
+            raise KeyboardInterrupt
+        return 0
+
+    checkpoint = tmp_path / 'ga.pickle'
+    ga = GeneticAlgorithm(fitness, population())
+    with pytest.raises(KeyboardInterrupt):
+        ga.run(10, checkpoint=checkpoint, checkpoint_every=100)
+
+    resumed = GeneticAlgorithm(fitness, population())
+    resumed.load_checkpoint(checkpoint)
+    assert resumed.generation == 2
+    assert resumed.best[1] == 0
+
+
+def test_patience_counts_improvements_of_at_most_min_delta_as_stale():
+    ga = GeneticAlgorithm(lambda agent: 0, population(2))
+    best_scores = iter([1.0, 1.5, 2.25, 2.75, 3.25, 4.0, 5.0])
+    ga.run_single_iteration = lambda: (ga.population, [next(best_scores), 0])
+
+    # 1.5 and the last two only improve by exactly min_delta, 2.25 resets
+    agent, score = ga.run(10, patience=2, min_delta=0.5)
+    assert ga.generation == 5
+    assert ga.stale == 2
+    assert score == 3.25
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import indicators
+from candles import CANDLE_DTYPE, Candles
+
+
+def random_walk(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+@pytest.mark.parametrize('span', [1, 2, 20, 500, 100000])
+def test_ema_matches_the_incremental_ema(span):
+    values = random_walk(5000)
+    ema = indicators.EMA(span)
+    expected = [ema.update(value) for value in values.tolist()]
+    np.testing.assert_allclose(indicators.ema(values, span),
+                               expected,
+                               rtol=1e-12)
+
+
+def test_atr_matches_the_incremental_atr():
+    close = random_walk(3000)
+    data = np.zeros(len(close), dtype=CANDLE_DTYPE)
+    data['close'] = close
+    data['high'] = close * 1.01
+    data['low'] = close * 0.98
+    candles = Candles(data)
+
+    atr = indicators.ATR(14)
+    expected = [atr.update(candle) for candle in candles.to_dicts()]
+    np.testing.assert_allclose(indicators.atr(candles, 14),
+                               expected,
+                               rtol=1e-12)
+
+
+def test_smoothing_short_inputs():
+    assert len(indicators.ema(np.array([]), 10)) == 0
+    assert indicators.ema(np.array([5.0]), 10).tolist() == [5.0]
@@ -0,0 +1,26 @@
+import instrument
+
+
+def double(x: int) -> int:
+    return 2 * x
+
+
+def test_disabled_hooks_do_nothing(monkeypatch):
+    monkeypatch.setattr(instrument, '_metrics', None)
+    assert instrument.timed('double')(double) is double
+    assert instrument.timer('a') is instrument.timer('b')
+    with instrument.timer('block'):
+        instrument.count('counter')
+
+
+def test_enabled_hooks_record(monkeypatch):
+    monkeypatch.setattr(instrument, '_metrics', instrument.Metrics())
+    timed_double = instrument.timed('double')(double)
+    assert timed_double(2) == 4
+    with instrument.timer('block'):
+        instrument.count('counter', 2)
+
+    metrics = instrument._metrics
+    assert metrics.histograms['double'].count == 1
+    assert metrics.histograms['block'].count == 1
+    assert metrics.counters == {'counter': 2}
@@ -0,0 +1,84 @@
+import os
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import islands
+from genetic import Agent
+
+
+def fitness(agent: Agent) -> float:
+    return -sum((gene.value - 0.5)**2 for gene in agent.genes)
+
+
+def crash(agent: Agent) -> float:
+    os._exit(3)  # like an island killed by the OOM killer
+
+
+def free_ports(n: int) -> list[int]:
+    sockets = [socket.socket() for _ in range(n)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def receive(endpoint: islands.Endpoint, batches: int) -> list[np.ndarray]:
+    """Wait for batches of migrants to arrive at endpoint"""
+    arrived = []
+    deadline = time.monotonic() + 5
+    while len(arrived) < batches and time.monotonic() < deadline:
+        arrived += endpoint.receive()
+        time.sleep(0.01)
+    return arrived
+
+
+def socket_transport() -> islands.SocketTransport:
+    addresses = [('localhost', port) for port in free_ports(2)]
+    return islands.SocketTransport(addresses, b'test')
+
+
+@pytest.mark.parametrize('transport',
+                         [lambda: islands.QueueTransport(2), socket_transport],
+                         ids=['queue', 'socket'])
+def test_migrants_go_around_the_ring(transport):
+    transport = transport()
+    first, second = transport.connect(0), transport.connect(1)
+    try:
+        migrants = np.random.default_rng(0).random((2, 3))
+        first.send(migrants)
+        first.send(migrants[:1])
+        arrived = receive(second, 2)
+        assert len(arrived) == 2
+        np.testing.assert_array_equal(arrived[0], migrants)
+        np.testing.assert_array_equal(arrived[1], migrants[:1])
+
+        second.send(migrants)  # back to the first island
+        assert len(receive(first, 1)) == 1
+        assert first.receive() == []
+    finally:
+        first.close()
+        second.close()
+
+
+def test_run_islands_returns_the_best_agent():
+    agent, score = islands.run_islands(fitness,
+                                       genes=3,
+                                       islands=2,
+                                       population=10,
+                                       generations=4,
+                                       interval=2,
+                                       seed=0)
+    assert len(agent.genes) == 3
+    assert score == pytest.approx(fitness(agent))
+
+
+def test_an_island_that_dies_fails_the_run():
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match='exit code 3'):
+        islands.run_islands(crash, genes=3, islands=2, population=4)
+    assert time.monotonic() - start < 10
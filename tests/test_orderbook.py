@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+
+from orderbook import Order, OrderBook
+from orders import OrderStatus, OrderType, Side
+
+TIME = datetime(2021, 9, 3)
+
+
+def order(id: int, side: Side, order_type: OrderType, price: float) -> Order:
+    return Order(id, 'BTC-USD', side, order_type, price, 1, None, TIME)
+
+
+def match(book: OrderBook, open: float, high: float, low: float) -> dict:
+    return {order.id: price for order, price in book.match(open, high, low)}
+
+
+def test_limit_orders_fill_when_the_price_reaches_them():
+    book = OrderBook()
+    book.add(order(1, Side.BUY, OrderType.LIMIT, 95))
+    book.add(order(2, Side.BUY, OrderType.LIMIT, 90))
+    book.add(order(3, Side.SELL, OrderType.LIMIT, 105))
+    book.add(order(4, Side.SELL, OrderType.LIMIT, 110))
+
+    assert match(book, 100, 104, 96) == {}
+    assert match(book, 100, 106, 94) == {1: 95, 3: 105}
+    assert len(book) == 2
+
+
+def test_stop_orders_trigger_when_the_price_trades_through_them():
+    book = OrderBook()
+    book.add(order(1, Side.BUY, OrderType.STOP, 105))
+    book.add(order(2, Side.SELL, OrderType.STOP, 95))
+    book.add(order(3, Side.SELL, OrderType.STOP, 90))
+
+    assert match(book, 100, 104, 96) == {}
+    assert match(book, 100, 106, 94) == {1: 105, 2: 95}
+    assert set(book.orders) == {3}
+
+
+def test_gaps_fill_at_the_open():
+    book = OrderBook()
+    book.add(order(1, Side.BUY, OrderType.LIMIT, 95))  # better price
+    book.add(order(2, Side.SELL, OrderType.STOP, 95))  # worse price
+    assert match(book, 90, 92, 88) == {1: 90, 2: 90}
+
+    book.add(order(3, Side.SELL, OrderType.LIMIT, 105))
+    book.add(order(4, Side.BUY, OrderType.STOP, 105))
+    assert match(book, 110, 112, 108) == {3: 110, 4: 110}
+
+
+def test_stops_fill_before_limits_and_older_orders_first():
+    book = OrderBook()
+    book.add(order(1, Side.BUY, OrderType.LIMIT, 95))
+    book.add(order(2, Side.BUY, OrderType.LIMIT, 95))
+    book.add(order(3, Side.SELL, OrderType.STOP, 95))
+    assert [o.id for o, _ in book.match(100, 100, 94)] == [3, 1, 2]
+
+
+def test_best_priced_orders_fill_first():
+    book = OrderBook()
+    for id, price in enumerate([91, 99, 93, 97, 95]):
+        book.add(order(id, Side.BUY, OrderType.LIMIT, price))
+    assert [o.price for o, _ in book.match(100, 100, 94)] == [99, 97, 95]
+
+
+def test_cancelled_orders_never_fill():
+    book = OrderBook()
+    orders = [order(i, Side.SELL, OrderType.LIMIT, 101 + i) for i in range(5)]
+    for o in orders:
+        book.add(o)
+    for o in orders[:4]:
+        book.cancel(o)
+    assert orders[0].status == OrderStatus.CANCEL
+    assert match(book, 100, 110, 100) == {4: 105}
+    assert len(book) == 0
+
+
+def test_market_orders_do_not_rest():
+    with pytest.raises(ValueError):
+        OrderBook().add(order(1, Side.BUY, OrderType.MARKET, 100))
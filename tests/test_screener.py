@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from candles import CANDLE_DTYPE, Candles
+from screener import Screener
+from utils import to_timestamp
+
+START = datetime(2021, 9, 3)
+
+
+def minutes(*candles: tuple[int, float, float]) -> Candles:
+    """Candles from (minute after START, low, high), closing at the low"""
+    data = np.zeros(len(candles), dtype=CANDLE_DTYPE)
+    offsets, data['low'], data['high'] = zip(*candles)
+    data['time'] = to_timestamp(START) + 60 * np.array(offsets)
+    data['close'] = data['low']
+    data['volume'] = 1
+    return Candles(data)
+
+
+def test_products_that_trade_late_in_the_window_are_screened():
+    screener = Screener(
+        {
+            'LIQUID-USD': minutes(*[(i, 100, 101) for i in range(10)]),
+            'ILLIQUID-USD': minutes((5, 100, 120), (8, 100, 120)),
+        }, 60, START, START + timedelta(minutes=10))
+    volatility = screener.volatility(10)
+    ranked = screener.rank(volatility, 2, START + timedelta(minutes=10))
+    assert [product for product, _ in ranked] == ['ILLIQUID-USD', 'LIQUID-USD']
+    assert np.isclose(ranked[0][1], 2 * (20 / 110) / 10)
+
+
+def test_gaps_carry_the_close_from_before_the_grid():
+    screener = Screener({'A-USD': minutes((-30, 100, 110), (3, 90, 95))}, 60,
+                        START, START + timedelta(minutes=5))
+    assert screener.close[0].tolist() == [100, 100, 100, 90, 90]
+    assert screener.high[0, 0] == screener.low[0, 0] == 100
+    assert np.isclose(screener.returns(3)[0, 3], -0.1)
+
+
+def test_products_without_a_trade_in_the_window_have_no_score():
+    screener = Screener(
+        {
+            'A-USD': minutes((0, 100, 101)),
+            'B-USD': minutes((8, 100, 101))
+        }, 60, START, START + timedelta(minutes=10))
+    volatility = screener.volatility(3)
+    assert np.isnan(volatility[1, 5])
+    assert not np.isnan(volatility[1, 9])
+    assert volatility[0, 5] == 0
@@ -0,0 +1,80 @@
+import builtins
+from datetime import datetime
+from decimal import Decimal
+
+import stream
+from stream import MarketStream, ReplayStream
+
+PRODUCT = 'BTC-USD'
+
+
+def trade(trade_id: int, time: str, price: str, size: str,
+          channel: str) -> dict:
+    """A trade as the ticker or the matches channel sends it"""
+    msg = {
+        'type': channel,
+        'product_id': PRODUCT,
+        'trade_id': trade_id,
+        'price': price,
+        'time': f'2021-09-03T00:{time}.000000Z'
+    }
+    msg['last_size' if channel == 'ticker' else 'size'] = size
+    return msg
+
+
+MESSAGES = [
+    {
+        'type': 'subscriptions'
+    },
+    trade(1, '00:05', '100', '1', 'match'),
+    trade(1, '00:05', '100', '1', 'ticker'),  # the same trade again
+    trade(2, '00:30', '104', '2', 'match'),
+    trade(3, '00:50', '98', '1', 'match'),
+    trade(3, '00:50', '98', '1', 'ticker'),
+    trade(4, '01:10', '101', '1', 'match'),
+]
+
+
+def replay(stream: ReplayStream) -> tuple[list, list]:
+    ticks, candles = [], []
+    stream.on_tick(lambda *tick: ticks.append(tick))
+    stream.on_candle(lambda *candle: candles.append(candle))
+    stream.start()
+    return ticks, candles
+
+
+def test_replay_counts_every_trade_once():
+    ticks, candles = replay(ReplayStream(MESSAGES))
+    assert [price for _, price, _ in ticks] == [100, 104, 98, 101]
+    assert ticks[0] == (PRODUCT, Decimal(100), datetime(2021, 9, 3, 0, 0, 5))
+    assert candles == [(PRODUCT, {
+        'time': 1630627200,
+        'low': 98.0,
+        'high': 104.0,
+        'open': 100.0,
+        'close': 98.0,
+        'volume': 4.0
+    })]
+
+
+def test_recordings_replay_like_the_live_stream(tmp_path, monkeypatch):
+    path = tmp_path / 'messages.jsonl'
+    live = MarketStream([PRODUCT], record=path)
+    live_ticks, live_candles = [], []
+    live.on_tick(lambda *tick: live_ticks.append(tick))
+    live.on_candle(lambda *candle: live_candles.append(candle))
+    for msg in MESSAGES:
+        live.on_message(msg)
+    live.on_close()
+
+    opened = []
+
+    def tracking_open(*args, **kwargs):
+        opened.append(builtins.open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(stream, 'open', tracking_open, raising=False)
+    replayed = ReplayStream.from_file(path)
+    assert replay(replayed) == (live_ticks, live_candles)
+    assert replayed.price(PRODUCT) == Decimal(101)
+    assert len(opened) == 1 and opened[0].closed
@@ -0,0 +1,159 @@
+import math
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from backtest import PriceFeed
+from candles import CANDLE_DTYPE, Candles
+from orders import OrderStatus, OrderType, Side
+from stream import ReplayStream
+import trader
+from utils import to_timestamp
+
+START = datetime(2021, 9, 3)
+FEE = float(trader.TestTrader.COINBASE_FEE)
+
+
+def feed(*candles: tuple[float, float, float, float]) -> PriceFeed:
+    """Price feed of 1 minute (open, high, low, close) candles from START"""
+    data = np.zeros(len(candles), dtype=CANDLE_DTYPE)
+    data['time'] = to_timestamp(START) + 60 * np.arange(len(candles))
+    data['open'], data['high'], data['low'], data['close'] = zip(*candles)
+    prices = PriceFeed(START, START + timedelta(minutes=len(candles)))
+    prices.add('BTC-USD', Candles(data))
+    return prices
+
+
+def simulated(prices: PriceFeed,
+              usd: float = 100,
+              **kwargs) -> trader.TestTrader:
+    return trader.TestTrader(None,
+                             usd,
+                             time=START,
+                             log=False,
+                             prices=prices,
+                             **kwargs)
+
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_market_orders_pay_the_fee_once(fast):
+    t = simulated(feed((100, 100, 100, 100), (110, 110, 110, 110)), fast=fast)
+    t.place_market_order('BTC-USD', Side.BUY)
+    assert math.isclose(t.balance['BTC'], 100 / (1 + FEE) / 100)
+    assert t.balance['USD'] == 0
+
+    t.wait(timedelta(minutes=1))
+    t.place_market_order('BTC-USD', Side.SELL)
+    assert math.isclose(t.balance['USD'], 100 / (1 + FEE) * 1.1 * (1 - FEE))
+    assert t.balance['BTC'] == 0
+
+
+def test_market_orders_settle_like_place_order():
+    prices = feed((100, 100, 100, 100))
+    a, b = simulated(prices), simulated(prices)
+    a.place_market_order('BTC-USD', Side.BUY, Decimal('0.5'))
+    b.place_order('BTC-USD', Side.BUY, funds=50)
+    assert a.balance == b.balance
+
+
+def test_fast_mode_reconciles_with_the_audit_ledger():
+    t = simulated(feed((100, 101, 99, 100), (100, 103, 97, 102)),
+                  fast=True,
+                  audit=True)
+    t.place_market_order('BTC-USD', Side.BUY, Decimal('0.3'))
+    t.place_order('BTC-USD', Side.BUY, OrderType.LIMIT, size=0.2, price=98)
+    t.place_order('BTC-USD', Side.SELL, OrderType.STOP, size=0.1, price=99)
+    t.wait(timedelta(minutes=1))
+    assert not t.open_orders()
+    t.balance.reconcile(t.audit_balance)
+
+
+def test_resting_orders_hold_their_funds_until_filled():
+    t = simulated(feed((100, 100, 100, 100), (100, 101, 94, 96)))
+    order = t.place_order('BTC-USD',
+                          Side.BUY,
+                          OrderType.LIMIT,
+                          size=Decimal('0.5'),
+                          price=95)
+    held = Decimal('0.5') * 95 * (1 + trader.TestTrader.COINBASE_FEE)
+    assert t.balance['USD'] == 100 - held
+    assert t.portfolio_value() == 100
+
+    t.wait(timedelta(minutes=1))
+    assert order.status == OrderStatus.FILLED
+    assert t.balance['BTC'] == Decimal('0.5')
+    assert math.isclose(t.balance['USD'], 100 - 0.5 * 95 * (1 + FEE))
+    assert not t.reserved['USD']
+
+
+def test_cancelling_releases_the_funds():
+    t = simulated(feed((100, 100, 100, 100)))
+    order = t.place_order('BTC-USD',
+                          Side.BUY,
+                          OrderType.LIMIT,
+                          funds=40,
+                          price=90)
+    assert t.balance['USD'] == 60
+    t.cancel_order(order)
+    assert order.status == OrderStatus.CANCEL
+    assert t.balance['USD'] == 100
+    with pytest.raises(ValueError):
+        t.cancel_order(order)
+
+
+def test_orders_the_balance_cant_cover_are_rejected_or_cancelled():
+    t = simulated(feed((100, 100, 100, 100), (115, 120, 115, 120)))
+    with pytest.raises(ValueError):
+        t.place_order('BTC-USD', Side.SELL, size=1)
+    with pytest.raises(ValueError):
+        t.place_order('BTC-USD', Side.BUY, OrderType.LIMIT, size=2, price=99)
+
+    # the stop gaps past its price and costs more than it held
+    stop = t.place_order('BTC-USD',
+                         Side.BUY,
+                         OrderType.STOP,
+                         size=Decimal('0.9'),
+                         price=110)
+    t.place_market_order('BTC-USD', Side.BUY)  # spend everything else
+    t.wait(timedelta(minutes=1))
+    assert stop.status == OrderStatus.CANCEL
+    assert not t.open_orders()
+
+
+def test_live_trader_prices_and_fills_from_the_stream():
+    ticks = [{
+        'type': 'match',
+        'product_id': 'BTC-USD',
+        'trade_id': i,
+        'price': price,
+        'size': '1',
+        'time': f'2021-09-03T00:00:0{i}.000000Z'
+    } for i, price in enumerate(['100', '96', '94'])]
+    stream = ReplayStream(ticks[:1])
+    t = trader.TestTrader(None, 100, log=False, stream=stream)
+    stream.start()  # no client, so prices can only come from the stream
+    t.place_market_order('BTC-USD', Side.BUY, Decimal('0.5'))
+    assert t.balance['USD'] == 50
+    assert t.balance['BTC'] == 50 / (1 + trader.TestTrader.COINBASE_FEE) / 100
+
+    order = t.place_order('BTC-USD',
+                          Side.BUY,
+                          OrderType.LIMIT,
+                          size=Decimal('0.1'),
+                          price=95)
+    stream.messages = ticks[1:2]
+    stream.start()
+    assert order.status != OrderStatus.FILLED
+    stream.messages = ticks[2:]
+    stream.start()
+    assert order.status == OrderStatus.FILLED
+    assert t.get_product_price('BTC-USD') == 94
+
+
+def test_traders_dont_share_reservations():
+    a, b = trader.Trader(None, 100), trader.Trader(None, 100)
+    a.reserved['USD'] = Decimal(10)
+    assert b.reserved == {}
+    assert a.holdings()['USD'] == 110
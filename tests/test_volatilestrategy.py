@@ -0,0 +1,81 @@
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from candles import CANDLE_DTYPE, Candles
+from downloader import Downloader
+from utils import to_timestamp
+from volatilestrategy import VolatileStrategy
+
+START = datetime(2021, 9, 3)
+END = START + timedelta(hours=4)
+
+
+class StubDownloader(Downloader):
+    """Product A swings for the first two hours, B for the rest"""
+    def __init__(self):
+        super().__init__(None)
+        self.requested = []
+
+    def product_list(self) -> list[dict[str, str]]:
+        return [{'id': 'A-USD'}, {'id': 'B-USD'}, {'id': 'B-EUR'}]
+
+    def backfill_many(self, tickers: list[str], start: datetime, end: datetime,
+                      granularity: int) -> dict[str, Candles]:
+        self.requested.append((tickers, start, end, granularity))
+        times = np.arange(to_timestamp(start), to_timestamp(end), granularity)
+        swings = times < to_timestamp(START + timedelta(hours=2))
+        result = {}
+        for ticker, spread in zip(tickers, [swings, ~swings]):
+            data = np.zeros(len(times), dtype=CANDLE_DTYPE)
+            data['time'] = times
+            data['close'] = 100
+            data['high'] = 100 + 10 * spread + 1
+            data['low'] = 100 - 1
+            result[ticker] = Candles(data)
+        return result
+
+
+def test_products_are_screened_until_the_backtest_ends():
+    strategy = VolatileStrategy(START)
+    strategy.end_time = END
+    downloader = StubDownloader()
+    strategy.download_data(downloader)
+
+    [(tickers, start, end, granularity)] = downloader.requested
+    assert tickers == ['A-USD', 'B-USD']
+    assert (start, end) == (START - timedelta(hours=1), END)
+    assert granularity == 60
+
+    for time, best in [(START, 'A-USD'), (START + timedelta(hours=3), 'B-USD'),
+                       (END, 'B-USD')]:
+        ranked = strategy.find_volatile_tickers(time)
+        assert ranked[0]['id'] == best
+        assert not any(math.isnan(p['volatility']) for p in ranked)
+
+
+def test_screening_is_done_in_bounded_blocks(monkeypatch):
+    monkeypatch.setattr(VolatileStrategy, 'SCREEN_BLOCK', timedelta(hours=1))
+    strategy = VolatileStrategy(START)
+    strategy.end_time = END
+    strategy.download_data(StubDownloader())
+
+    for hours, best in [(0.5, 'A-USD'), (1.5, 'A-USD'), (2.5, 'B-USD'),
+                        (4, 'B-USD')]:
+        time = START + timedelta(hours=hours)
+        assert strategy.find_volatile_tickers(time)[0]['id'] == best
+        assert strategy.screener.length == 2 * 60  # lookback and block
+    assert strategy.block == START + timedelta(hours=3)
+
+
+def test_only_the_universe_is_screened():
+    strategy = VolatileStrategy(START)
+    strategy.end_time = END
+    strategy.universe = ['B-USD', 'B-EUR']
+    downloader = StubDownloader()
+    strategy.download_data(downloader)
+
+    [(tickers, _, _, _)] = downloader.requested
+    assert tickers == ['B-USD']
+    assert [p['id'] for p in strategy.find_volatile_tickers()] == ['B-USD']
@@ -1,216 +1,307 @@
-from asyncio import LimitOverrunError
-import math
-from tabulate import tabulate
+from __future__ import annotations
+
+import queue
+import threading
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from decimal import Decimal
-from enum import Enum
-from fileinput import close
-from typing import Literal, Optional
-from xmlrpc.client import Boolean
-
-import colorama
-from cbpro import AuthenticatedClient as CBProClient
-from colorama import Back, Fore, Style
-
-from utils import sign
-
-
-class Side(Enum):
-    BUY = 'buy'
-    SELL = 'sell'
+from decimal import ROUND_DOWN, Decimal
+from itertools import count
+from time import sleep
+from typing import TYPE_CHECKING, Iterable, MutableMapping, Optional
 
+from colorama import Fore
 
-class OrderType(Enum):
-    LIMIT = 'limit'
-    MARKET = 'market'
-    STOP = 'stop'
+import instrument
+from backtest import EndOfData, PriceFeed
+from eventlog import OrderEventLog
+from ledger import FastLedger
+from orderbook import Order, OrderBook
+from orders import OrderStatus, OrderType, Side, format_order
+from utils import RateLimiter, from_timestamp, to_timestamp
 
+if TYPE_CHECKING:
+    from cbpro import AuthenticatedClient as CBProClient
 
-class OrderStatus(Enum):
-    PLACED = 1
-    FILLED = 2
-    CANCEL = 3
+    from stream import MarketStream
 
 
 class Trader:
+    MAX_WORKERS = 8  # for fetching prices concurrently
+    number = Decimal  # numeric type of balances and prices
+    events: Optional[OrderEventLog] = None  # structured order log
+
     def __init__(self, client: CBProClient, usd: float, log=True):
         self.client = client
         self.balance = {'USD': Decimal(usd)}
+        self.reserved: dict[str, Decimal] = {}  # held by orders not done
         self.log = log
 
     def log_order(self, coin_name: str, currency_name: str, side: Side,
                   order_type: OrderType, order_status: OrderStatus,
                   price: float, size: float, unit_price: float,
-                  fee_amount: float, order_time: datetime, is_real: Boolean):
-        if not self.log:
-            return
+                  fee_amount: float, order_time: datetime, is_real: bool):
+        if self.events is not None:
+            self.events.record(coin_name, currency_name, side, order_type,
+                               order_status, price, size, unit_price,
+                               fee_amount, order_time, is_real)
+        if self.log:
+            print(
+                format_order(coin_name, currency_name, side, order_type,
+                             order_status, price, size, unit_price, fee_amount,
+                             order_time, is_real))
 
-        # format:
-        # [TIME] [TYPE ORDER PLACED|FILLED|CANCELLED] +- 12.34 COIN +- $12.3456 USD @ $12.3456 USD / COIN
-        l = Fore.WHITE + '['
-        r = Fore.WHITE + ']'
+    def log_portfolio(self):
+        raise NotImplementedError
 
-        time = Fore.RED if is_real else Fore.WHITE
-        time += order_time.strftime('%m-%d-%y %H:%M:%S')
+    def get_product_price(self, product_id) -> Decimal:
+        raise NotImplementedError
 
-        order = {
-            OrderStatus.PLACED: Fore.YELLOW,
-            OrderStatus.FILLED: Fore.GREEN,
-            OrderStatus.CANCEL: Fore.RED
-        }[order_status]
-        order += f'{order_type.name} ORDER {order_status.name}'
-        order = l + order + r
+    def get_asset_price(self, asset):
+        if asset == 'USD':
+            return self.number(1)
+        return self.get_product_price(f'{asset}-USD')
 
-        coin = f'{Fore.GREEN}+ ' if side == Side.BUY else f'{Fore.RED}- '
-        coin += f'{size!s:18.18} {coin_name:5.5}'
+    def get_asset_prices(self, assets: list[str]) -> dict[str, Decimal]:
+        """Get the prices of several assets, fetching them concurrently"""
+        with ThreadPoolExecutor(self.MAX_WORKERS) as pool:
+            return dict(zip(assets, pool.map(self.get_asset_price, assets)))
 
-        currency = f'{Fore.RED}- ' if side == Side.BUY else f'{Fore.GREEN}+ '
-        currency += f'${price!s:18.18} {currency_name:5.5}'
+    def holdings(self) -> dict[str, Decimal]:
+        """
+        Snapshot of the portfolio, including the funds held by orders that
+        aren't done yet
+        """
+        holdings = dict(self.balance)
+        for asset, quantity in self.reserved.items():
+            if quantity:
+                holdings[asset] = holdings.get(asset, 0) + quantity
+        return holdings
+
+    def held_assets(self) -> list[str]:
+        return [
+            asset for asset, quantity in self.holdings().items() if quantity
+        ]
+
+    def held_asset_prices(self) -> dict[str, Decimal]:
+        """Get the prices of every asset in the portfolio"""
+        return self.get_asset_prices(self.held_assets())
+
+    def portfolio_value(self,
+                        prices: Optional[dict[str, Decimal]] = None,
+                        holdings: Optional[dict[str, Decimal]] = None):
+        if holdings is None:
+            holdings = self.holdings()
+        if prices is None:
+            prices = self.get_asset_prices(
+                [asset for asset, quantity in holdings.items() if quantity])
+        total = 0
+        for (asset, quantity) in holdings.items():
+            if quantity == 0:
+                continue
+            unit_price = prices[asset]
+            value = unit_price * quantity
+            total += value
+        return total
 
-        fee = Fore.RED if (fee_amount) else Fore.WHITE
-        fee += f'F${fee_amount:2.2f}'
+    def show_portfolio(self):
+        from tabulate import tabulate  # slow to import, rarely needed
 
-        unit = f'{Fore.WHITE}@ ${unit_price:.7f} {currency_name} / {coin_name}'
+        table = []
+        holdings = self.holdings()
+        prices = self.get_asset_prices(
+            [asset for asset, quantity in holdings.items() if quantity])
+        total = self.portfolio_value(prices, holdings)
+        for (asset, quantity) in holdings.items():
+            if quantity == 0:
+                continue
 
-        print(f'{l}{time}{r} {order} {fee} {coin} {currency} {unit}')
+            unit_price = prices[asset]
+            value = unit_price * quantity
+            table.append([
+                asset, f'{value / total:.2%}', f'${value:.2f}', quantity,
+                f'${unit_price:.2f}'
+            ])
 
-    def log_portfolio(self):
-        raise NotImplementedError
+        print(f'Total Portfolio Value: ${total:.2f} USD')
+        print('Breakdown:')
+        headers = ['Asset', 'Holdings', 'Value', 'Quantity', 'Price']
+        print(tabulate(table, headers=headers))
 
     def place_market_order(self, product_id: str, side: Side,
                            percentage: float):
         raise NotImplementedError
 
+    def place_order(self,
+                    product_id: str,
+                    side: Side,
+                    order_type: OrderType = OrderType.MARKET,
+                    size: Optional[float] = None,
+                    funds: Optional[float] = None,
+                    price: Optional[float] = None):
+        raise NotImplementedError
+
     def wait(self, delta: timedelta):
         raise NotImplementedError
 
 
 class TestTrader(Trader):
     def get_product_price(self, product_id) -> Decimal:
+        """
+        Get the price of a product at the simulated time.
+        Prices are cached until wait() moves the clock, so every valuation
+        within one step sees the same snapshot.
+        """
+        if not self.time:  # realtime, prices are always fresh
+            return self.fetch_product_price(product_id)
+        key = (product_id, self.time)
+        if key not in self.price_cache:
+            instrument.count('trader.price.miss')
+            self.price_cache[key] = self.fetch_product_price(product_id)
+        else:
+            instrument.count('trader.price.hit')
+        return self.price_cache[key]
+
+    def fetch_product_price(self, product_id) -> Decimal:
+        if self.prices:
+            return self.number(self.prices.price(product_id, self.time))
+        if self.stream and product_id in self.stream.last_price:
+            return self.number(self.stream.price(product_id))
+
+        self.limiter.acquire()
         now = datetime.now()
-        if now < self.time:
+        if self.time and now < self.time:
             raise ValueError("self.time is in the future")
         min_difference = timedelta(minutes=1, seconds=1)
         if self.time and min_difference < now - self.time:
-            historical_data = self.client.get_product_historic_rates(
-                product_id, start=self.time, end=self.time, granularity=60)[0]
-            unit_price = Decimal(historical_data[4])  # close price
+            with instrument.timer('api.get_product_historic_rates'):
+                historical_data = self.client.get_product_historic_rates(
+                    product_id, start=self.time, end=self.time,
+                    granularity=60)[0]
+            unit_price = self.number(historical_data[4])  # close price
         else:
-            product_info = self.client.get_product_ticker(product_id)
-            unit_price = Decimal(product_info['price'])
+            with instrument.timer('api.get_product_ticker'):
+                product_info = self.client.get_product_ticker(product_id)
+            unit_price = self.number(product_info['price'])
         return unit_price
+
     COINBASE_FEE = Decimal(0.005)
+    REQUESTS_PER_SECOND = 10  # public endpoint rate limit
 
     def __init__(self,
-                 client: CBProClient,
+                 client: Optional[CBProClient],
                  usd: float,
                  time: Optional[datetime] = None,
-                 log=True):
+                 log=True,
+                 prices: Optional[PriceFeed] = None,
+                 limiter: Optional[RateLimiter] = None,
+                 fast: bool = False,
+                 audit: bool = False,
+                 events: Optional[OrderEventLog] = None,
+                 stream: Optional[MarketStream] = None):
+        """
+        When prices is given, the trader runs as an offline backtest: every
+        price comes from the feed and wait() only advances the simulated clock.
+        fast keeps balances in a float FastLedger instead of Decimals; with
+        audit, every order is also replayed on an exact Decimal ledger and the
+        two are reconciled. events records every order in a structured log.
+        With stream, a realtime trader prices the streamed products at their
+        last trade and fills resting orders as trades arrive.
+        """
+        if prices and not time:
+            raise ValueError("backtests need a start time")
+        if stream and time:
+            raise ValueError("live streams need a realtime trader")
         self.client = client
         self.time = time
-        self.balance = defaultdict(Decimal)
-        self.balance['USD'] = Decimal(usd)
+        self.number = float if fast else Decimal
+        self.fee_rate = self.number(self.COINBASE_FEE)  # converted once
+        self.balance = FastLedger() if fast else defaultdict(Decimal)
+        self.balance['USD'] = self.number(usd)
+        self.audit_balance = None
+        if fast and audit:
+            self.audit_balance = defaultdict(Decimal)
+            self.audit_balance['USD'] = Decimal(usd)
         self.log = log
-
-    def get_asset_price(self, asset):
-        if asset == 'USD':
-            return Decimal(1)
-        product = f'{asset}-USD'
-        info = self.client.get_product_ticker(product)
-        return Decimal(info['price'])
-
-    def portfolio_value(self):
-        total = 0
-        for (asset, quantity) in self.balance.items():
-            unit_price = self.get_asset_price(asset)
-            value = unit_price * quantity
-            total += value
-        return total
-
-    def show_portfolio(self):
-        table = []
-        total = self.portfolio_value()
-        for (asset, quantity) in self.balance.items():
-            if quantity == 0:
-                continue
-
-            unit_price = self.get_asset_price(asset)
-            value = unit_price * quantity
-            table.append([
-                asset, f'{value / total:.2%}', f'${value:.2f}', quantity,
-                f'${unit_price:.2f}'
-            ])
-
-        print(f'Total Portfolio Value: ${total:.2f} USD')
-        print('Breakdown:')
-        headers = ['Asset', 'Holdings', 'Value', 'Quantity', 'Price']
-        print(tabulate(table, headers=headers))
+        self.events = events
+        self.prices = prices
+        self.limiter = limiter or RateLimiter(self.REQUESTS_PER_SECOND)
+        self.price_cache: dict[tuple[str, datetime], Decimal] = {}
+        self.books: dict[str, OrderBook] = {}  # resting orders by product
+        self.reserved = defaultdict(self.number)  # held by resting orders
+        self.holds: defaultdict[str, int] = defaultdict(int)  # their count
+        self.order_ids = count(1)
+        self.stream = stream
+        if stream:
+            stream.on_tick(self.match_tick)
+
+    def get_asset_prices(self, assets: list[str]) -> dict[str, Decimal]:
+        """Get the prices of several assets, fetching them concurrently"""
+        uncached = [
+            asset for asset in assets
+            if asset != 'USD' and (f'{asset}-USD',
+                                   self.time) not in self.price_cache
+        ]
+        fetched = {}
+        if not self.prices and len(uncached) > 1:
+            with ThreadPoolExecutor(self.MAX_WORKERS) as pool:
+                fetched = dict(
+                    zip(uncached, pool.map(self.get_asset_price, uncached)))
+        return {
+            asset:
+            fetched[asset] if asset in fetched else self.get_asset_price(asset)
+            for asset in assets
+        }
 
     def wait(self, delta: timedelta):
+        if self.prices and self.time + delta >= self.prices.end:
+            raise EndOfData(f"backtest ended at {self.prices.end}")
+        start = self.time
         self.time += delta
-        print(f'{Fore.CYAN}-- WAIT SIMULATION: {delta} --')
+        self.price_cache.clear()
+        self.match_orders(start, self.time)
+        if self.log:
+            print(f'{Fore.CYAN}-- WAIT SIMULATION: {delta} --')
 
+    @instrument.timed('trader.order')
     def place_market_order(self,
                            product_id: str,
                            side: Side,
                            percentage: Decimal = Decimal(1)):
         """
         Buy or sell an asset at the current market price.
-        When buying, percentage is the amount of currency to spend on the asset.
-        When selling, percentage is the amount of the asset to sell.
+        When buying, percentage is the amount of currency to spend on the
+        asset, fee included. When selling, percentage is the amount of the
+        asset to sell, and the fee is taken from the proceeds. Fills are
+        settled like those of place_order.
         """
-        # get some product info
-        now = datetime.now()
-        if now < self.time:
-            raise ValueError("self.time is in the future")
-
-        min_difference = timedelta(minutes=1, seconds=1)
-        if self.time and min_difference < now - self.time:
-            historical_data = self.client.get_product_historic_rates(
-                product_id, start=self.time, end=self.time, granularity=60)[0]
-            unit_price = Decimal(historical_data[4])  # close price
-        else:
-            product_info = self.client.get_product_ticker(product_id)
-            unit_price = Decimal(product_info['price'])
+        unit_price = self.get_product_price(product_id)
 
         # format for product_id is 'BTC-USD'
-        # figure out which asset we are selling and which we are buying
         coin_name, curr_name = product_id.split('-')
+        size = funds = None
         if side == Side.BUY:
             # buying: curr --> coin
-            from_currency, to_currency = curr_name, coin_name
-        if side == Side.SELL:
-            # selling: coin --> curr
-            from_currency, to_currency = coin_name, curr_name
-
-        # calculate how much actual currency we are buying/selling, using percentage.
-        from_amount = self.balance[from_currency] * percentage
-        if side == Side.BUY:
-            # # of coins == $ / unit price
-            from_amount -= from_amount * self.COINBASE_FEE
-            to_amount = from_amount / unit_price
-            price = from_amount
-            size = to_amount
+            funds = self.balance[curr_name] * self.number(percentage)
         else:
-            # $ = # of coins * unit price
-            to_amount = from_amount * unit_price
-            to_amount -= self.COINBASE_FEE
-            price = to_amount
-            size = from_amount
-
-        if price <= 0:
-            raise ValueError("order price is <= 0")
-
-        if size <= 0:
-            raise ValueError("order size is <= 0")
-
-        # simulate purchase
-        fee = price * self.COINBASE_FEE
-        self.balance[curr_name] -= fee
-        self.balance[from_currency] -= from_amount
-        self.balance[to_currency] += to_amount
+            # selling: coin --> curr
+            size = self.balance[coin_name] * self.number(percentage)
+        if (funds if size is None else size) <= 0:
+            raise ValueError("order amount is <= 0")
+
+        filled = self._settle(self.balance, self.number, self.fee_rate,
+                              product_id, side, size, funds, unit_price)
+        if filled is None:
+            raise ValueError("order amount is more than the balance")
+        if self.audit_balance is not None:
+            self._settle(self.audit_balance, Decimal, self.COINBASE_FEE,
+                         product_id, side, size, funds, unit_price)
+            self.balance.reconcile(self.audit_balance)
+
+        if not self.log and self.events is None:
+            return
 
+        price, size, fee = filled
         self.log_order(coin_name=coin_name,
                        currency_name=curr_name,
                        side=side,
@@ -234,16 +325,442 @@ class TestTrader(Trader):
                        fee_amount=fee,
                        order_time=self.time or datetime.now(),
                        is_real=False)
-    
+
+    @instrument.timed('trader.order')
+    def place_order(self,
+                    product_id: str,
+                    side: Side,
+                    order_type: OrderType = OrderType.MARKET,
+                    size: Optional[float] = None,
+                    funds: Optional[float] = None,
+                    price: Optional[float] = None) -> Order:
+        """
+        Place an order for a fixed amount, like the exchange's place_order.
+        Give either size, the amount of the asset, or when buying funds, the
+        amount of currency to spend including the fee.
+        Market orders fill right away at the current price. Limit orders
+        rest until a candle trades at price or better, and stop orders until
+        one trades through price; wait() matches them against the candles
+        it steps over. Resting orders hold their funds until they fill or
+        are cancelled, and are cancelled if the balance can't cover them.
+        """
+        if (size is None) == (funds is None):
+            raise ValueError("give either size or funds")
+        if funds is not None and side != Side.BUY:
+            raise ValueError("only buy orders can be placed with funds")
+        if order_type != OrderType.MARKET and price is None:
+            raise ValueError(f"{order_type.name} orders need a price")
+        if (funds if size is None else size) <= 0:
+            raise ValueError("order amount is <= 0")
+        if price is not None and price <= 0:
+            raise ValueError("order price is <= 0")
+
+        order = Order(next(self.order_ids), product_id, side, order_type,
+                      price, size, funds, self.time or datetime.now())
+        if order_type == OrderType.MARKET:
+            self._log_order(order, OrderStatus.PLACED, order.time)
+            if not self._fill(order, self.get_product_price(product_id),
+                              order.time):
+                raise ValueError(f"balance can't cover {order}")
+            return order
+
+        currency = order.reserved_currency
+        reserved = self._reservation(self.number, order)
+        if reserved > self.balance[currency]:
+            raise ValueError(f"{currency} balance can't cover {order}")
+        for balance, number in self._ledgers():
+            balance[currency] -= self._reservation(number, order)
+        order.reserved = reserved
+        self.reserved[currency] += reserved
+        self.holds[currency] += 1
+        self.books.setdefault(product_id, OrderBook()).add(order)
+        self._log_order(order, OrderStatus.PLACED, order.time)
+        return order
+
+    def cancel_order(self, order: Order):
+        """Cancel a resting order and release its funds"""
+        book = self.books.get(order.product_id)
+        if book is None or order.id not in book.orders:
+            raise ValueError(f"{order} is not open")
+        book.cancel(order)
+        self._release(order)
+        self._log_order(order, OrderStatus.CANCEL, self.time)
+
+    def open_orders(self, product_id: Optional[str] = None) -> list[Order]:
+        """Get the resting orders, of every product by default"""
+        books = self.books.values() if product_id is None else [
+            self.books.get(product_id, OrderBook())
+        ]
+        return [order for book in books for order in book.orders.values()]
+
+    def match_orders(self, start: datetime, end: datetime):
+        """Fill the resting orders that trade between start and end"""
+        for product_id, book in self.books.items():
+            if not book:
+                continue
+            for time, open, high, low in self._candles(product_id, start, end):
+                for order, unit_price in book.match(open, high, low):
+                    self._fill(order, unit_price, from_timestamp(time))
+
+    def match_tick(self, product_id: str, price: Decimal, time: datetime):
+        """Fill the resting orders a live trade of product_id crosses"""
+        book = self.books.get(product_id)
+        if not book:
+            return
+        price = float(price)
+        for order, unit_price in book.match(price, price, price):
+            self._fill(order, unit_price, time)
+
+    def _candles(self, product_id: str, start: datetime,
+                 end: datetime) -> Iterable[tuple[int, float, float, float]]:
+        """(time, open, high, low) of the candles between start and end"""
+        if self.prices:
+            candles = self.prices.candles(product_id, start, end)
+            return zip(candles.time.tolist(), candles.open.tolist(),
+                       candles.high.tolist(), candles.low.tolist())
+        # without a feed there are no candles, match the price at end
+        price = float(self.get_product_price(product_id))
+        return [(to_timestamp(end), price, price, price)]
+
+    def _fill(self, order: Order, unit_price: float, time: datetime) -> bool:
+        """
+        Settle an order at unit_price. A resting order the balance can't
+        cover is cancelled instead; returns whether the order filled.
+        """
+        self._release(order)
+        filled = self._settle(self.balance, self.number, self.fee_rate,
+                              order.product_id, order.side, order.size,
+                              order.funds, unit_price)
+        if filled is None:
+            if order.order_type != OrderType.MARKET:
+                order.status = OrderStatus.CANCEL
+                self._log_order(order, OrderStatus.CANCEL, time)
+            return False
+        if self.audit_balance is not None:
+            self._settle(self.audit_balance, Decimal, self.COINBASE_FEE,
+                         order.product_id, order.side, order.size, order.funds,
+                         unit_price)
+            self.balance.reconcile(self.audit_balance)
+
+        order.status = OrderStatus.FILLED
+        self._log_order(order, OrderStatus.FILLED, time, *filled, unit_price)
+        return True
+
+    def _settle(self, balance: MutableMapping, number, fee_rate,
+                product_id: str, side: Side, size, funds,
+                unit_price) -> Optional[tuple]:
+        """
+        Apply a fill of size, or of funds when buying, to balance, doing the
+        arithmetic in number. Every fill pays fee_rate on its value:
+        buys pay it on top, out of the funds, and sells out of the proceeds.
+        Returns the fill's price, size and fee, or None if the balance can't
+        cover it.
+        """
+        coin_name, curr_name = product_id.split('-')
+        unit_price = number(unit_price)
+        if funds is not None:
+            cost = number(funds)
+            price = cost / (1 + fee_rate)
+            size = price / unit_price
+            fee = cost - price
+        else:
+            size = number(size)
+            price = size * unit_price
+            fee = price * fee_rate
+            cost = price + fee
+
+        if side == Side.BUY:
+            if cost > balance[curr_name]:
+                return None
+            balance[curr_name] -= cost
+            balance[coin_name] += size
+        else:
+            if size > balance[coin_name]:
+                return None
+            balance[coin_name] -= size
+            balance[curr_name] += price - fee
+        return price, size, fee
+
+    def _reservation(self, number, order: Order):
+        """Amount a resting order holds from the balance"""
+        if order.side == Side.SELL:
+            return number(order.size)
+        if order.funds is not None:
+            return number(order.funds)
+        return number(order.size) * number(
+            order.price) * (1 + number(self.COINBASE_FEE))
+
+    def _release(self, order: Order):
+        if not order.reserved:
+            return
+        currency = order.reserved_currency
+        for balance, number in self._ledgers():
+            balance[currency] += self._reservation(number, order)
+        self.holds[currency] -= 1
+        if self.holds[currency]:
+            self.reserved[currency] -= order.reserved
+        else:  # don't leave rounding errors behind
+            self.reserved[currency] = self.number(0)
+        order.reserved = 0
+
+    def _ledgers(self) -> Iterable[tuple[MutableMapping, type]]:
+        """The balance, and the exact audit balance if there is one"""
+        yield self.balance, self.number
+        if self.audit_balance is not None:
+            yield self.audit_balance, Decimal
+
+    def _log_order(self,
+                   order: Order,
+                   status: OrderStatus,
+                   time: datetime,
+                   price=None,
+                   size=None,
+                   fee=0,
+                   unit_price=None):
+        if not self.log and self.events is None:
+            return
+        coin_name, curr_name = order.product_id.split('-')
+        if price is None:  # not filled, log the order's own amounts
+            size = order.size or 0
+            price = order.funds or size * (order.price or 0)
+            unit_price = order.price or 0
+        self.log_order(coin_name=coin_name,
+                       currency_name=curr_name,
+                       side=order.side,
+                       order_status=status,
+                       order_type=order.order_type,
+                       price=price,
+                       size=size,
+                       unit_price=unit_price,
+                       fee_amount=fee,
+                       order_time=time or datetime.now(),
+                       is_real=False)
+
+
+class _Order:
+    """Order queued by CoinbaseTrader"""
+    def __init__(self, product_id: str, side: Side, amount: Decimal,
+                 future: Future):
+        self.product_id = product_id
+        self.side = side
+        self.amount = amount  # funds when buying, size when selling
+        self.future = future
+        self.id: Optional[str] = None
+        self.failed_polls = 0  # in a row
+
 
 class CoinbaseTrader(Trader):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        if self.time:
-            raise ValueError(
-                "CoinbaseTrader can only operate in realtime mode")
+    """
+    Trades on the real exchange, in realtime only.
+    Orders are queued and sent by a background thread over the client's
+    persistent session, paced by a token bucket. Another thread polls pending
+    orders until they fill. Balances live in a local ledger that is loaded
+    once; orders reserve their funds when queued and settle on fill.
+    """
+    REQUESTS_PER_SECOND = 5  # private endpoint rate limit
+    FILL_POLL_INTERVAL = 0.5  # seconds
+    MAX_FAILED_POLLS = 10  # before an order is given up on
+
+    def __init__(self,
+                 client: CBProClient,
+                 log=True,
+                 limiter: Optional[RateLimiter] = None,
+                 events: Optional[OrderEventLog] = None):
+        self.client = client
+        self.time = None  # realtime
+        self.log = log
+        self.events = events
+        self.limiter = limiter or RateLimiter(self.REQUESTS_PER_SECOND)
+
+        self.balance: defaultdict[str, Decimal] = defaultdict(Decimal)
+        self.reserved: defaultdict[str, Decimal] = defaultdict(Decimal)
+        self.balance_lock = threading.Lock()  # the tracker thread settles
+        self.sync_balances()
+        self.increments = {
+            p['id']:
+            (Decimal(p['base_increment']), Decimal(p['quote_increment']))
+            for p in self.request(self.client.get_products)
+        }
+
+        self.orders: queue.Queue[Optional[_Order]] = queue.Queue()
+        self.pending: list[_Order] = []
+        self.pending_lock = threading.Lock()
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._send_orders, daemon=True),
+            threading.Thread(target=self._track_fills, daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def request(self, method, *args, **kwargs):
+        """Rate limited api call, raises on api errors"""
+        self.limiter.acquire()
+        with instrument.timer(f'api.{method.__name__}'):
+            response = method(*args, **kwargs)
+        if isinstance(response, dict) and 'message' in response:
+            raise RuntimeError(response['message'])
+        return response
+
+    def sync_balances(self):
+        """Reload the ledger from the exchange"""
+        accounts = self.request(self.client.get_accounts)
+        with self.balance_lock:
+            self.balance.clear()
+            for account in accounts:
+                self.balance[account['currency']] = Decimal(
+                    account['available'])
+
+    def holdings(self) -> dict[str, Decimal]:
+        with self.balance_lock:
+            return super().holdings()
+
+    def get_product_price(self, product_id) -> Decimal:
+        ticker = self.request(self.client.get_product_ticker, product_id)
+        return Decimal(ticker['price'])
+
+    def place_market_order(
+        self, product_id: str, side: Side,
+        percentage: Decimal = Decimal(1)) -> Future:
+        """
+        Queue an order to buy or sell an asset at the market price.
+        When buying, percentage is the amount of currency to spend on the asset.
+        When selling, percentage is the amount of the asset to sell.
+        Returns a future that resolves to the order once it is filled.
+        """
+        coin_name, curr_name = product_id.split('-')
+        base_increment, quote_increment = self.increments[product_id]
+        from_currency = curr_name if side == Side.BUY else coin_name
+        increment = quote_increment if side == Side.BUY else base_increment
+
+        with self.balance_lock:
+            amount = self.balance[from_currency] * Decimal(percentage)
+            amount = amount.quantize(increment, rounding=ROUND_DOWN)
+            if amount <= 0:
+                raise ValueError("order amount is <= 0")
+            self.balance[from_currency] -= amount  # reserve until filled
+            self.reserved[from_currency] += amount
+
+        order = _Order(product_id, side, amount, Future())
+        self.orders.put(order)
+        return order.future
+
+    def wait(self, delta: timedelta):
+        sleep(delta.total_seconds())
+
+    def close(self):
+        """Stop the background threads once every queued order has filled"""
+        sender, tracker = self.threads
+        self.orders.put(None)
+        sender.join()
+        self.running = False
+        tracker.join()
+
+    def _send_orders(self):
+        while (order := self.orders.get()) is not None:
+            side = order.side.value
+            if order.side == Side.BUY:
+                kwargs = {'funds': str(order.amount)}
+            else:
+                kwargs = {'size': str(order.amount)}
+            try:
+                placed = self.request(self.client.place_market_order,
+                                      order.product_id, side, **kwargs)
+            except Exception as e:
+                self._release(order)
+                order.future.set_exception(e)
+                continue
+
+            order.id = placed['id']
+            self._log(order, placed, OrderStatus.PLACED)
+            with self.pending_lock:
+                self.pending.append(order)
+
+    def _track_fills(self):
+        while self.running or self.pending:
+            with self.pending_lock:
+                pending = list(self.pending)
+            for order in pending:
+                try:
+                    status = self.request(self.client.get_order, order.id)
+                except Exception as e:
+                    order.failed_polls += 1
+                    if order.failed_polls >= self.MAX_FAILED_POLLS:
+                        # assume nothing filled, sync_balances() to be sure
+                        self._drop(order, e)
+                    continue  # try again next round
+                order.failed_polls = 0
+                if status.get('status') == 'rejected':
+                    reason = status.get('reject_reason', 'unknown reason')
+                    self._drop(order,
+                               RuntimeError(f"order rejected: {reason}"))
+                    continue
+                if status.get('status') != 'done':
+                    continue
+
+                self._settle(order, status)
+                with self.pending_lock:
+                    self.pending.remove(order)
+                self._log(order, status, OrderStatus.FILLED)
+                order.future.set_result(status)
+            sleep(self.FILL_POLL_INTERVAL)
+
+    def _drop(self, order: _Order, error: Exception):
+        """Stop tracking an order that failed, returning its funds"""
+        with self.pending_lock:
+            self.pending.remove(order)
+        self._release(order)
+        self._log(order, {}, OrderStatus.CANCEL)
+        order.future.set_exception(error)
+
+    def _settle(self, order: _Order, status: dict):
+        """Apply a filled order to the ledger"""
+        coin_name, curr_name = order.product_id.split('-')
+        size = Decimal(status['filled_size'])
+        value = Decimal(status['executed_value'])
+        fee = Decimal(status['fill_fees'])
+        with self.balance_lock:
+            if order.side == Side.BUY:
+                self.reserved[curr_name] -= order.amount
+                self.balance[coin_name] += size
+                # refund whatever part of the reserved funds wasn't used
+                self.balance[curr_name] += order.amount - value - fee
+            else:
+                self.reserved[coin_name] -= order.amount
+                self.balance[curr_name] += value - fee
+                self.balance[coin_name] += order.amount - size
+
+    def _release(self, order: _Order):
+        coin_name, curr_name = order.product_id.split('-')
+        currency = curr_name if order.side == Side.BUY else coin_name
+        with self.balance_lock:
+            self.reserved[currency] -= order.amount
+            self.balance[currency] += order.amount
+
+    def _log(self, order: _Order, status: dict, order_status: OrderStatus):
+        coin_name, curr_name = order.product_id.split('-')
+        fee = Decimal(0)
+        if order_status == OrderStatus.FILLED:
+            size = Decimal(status['filled_size'])
+            price = Decimal(status['executed_value'])
+            fee = Decimal(status['fill_fees'])
+        elif order.side == Side.BUY:
+            size, price = Decimal(0), order.amount
+        else:
+            size, price = order.amount, Decimal(0)
+        self.log_order(coin_name=coin_name,
+                       currency_name=curr_name,
+                       side=order.side,
+                       order_status=order_status,
+                       order_type=OrderType.MARKET,
+                       price=price,
+                       size=size,
+                       unit_price=price / size if size else 0,
+                       fee_amount=fee,
+                       order_time=datetime.now(),
+                       is_real=True)
 
 
 def split(n: int):
     for i in range(n, 0, -1):
-        yield 1 / i
\ No newline at end of file
+        yield 1 / i
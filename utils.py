@@ -1,9 +1,15 @@
 import itertools
 import math
+import threading
+import time
+from datetime import datetime, timezone
 from functools import wraps
+from typing import Optional
 
 import diskcache
 
+import instrument
+
 
 def clamp(n: float, min_val: float = 0, max_val: float = 1) -> float:
     """Clamp a value in the range [min_val, max_val)"""
@@ -26,13 +32,57 @@ def sign(n: float):
     return '+'
 
 
-def memoize_diskcache(cache: diskcache.Cache):
+class RateLimiter:
+    """Token bucket rate limiter that can be shared between threads"""
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate  # tokens added per second
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self.lock:
+                current = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (current - self.updated) * self.rate)
+                self.updated = current
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def to_timestamp(time: datetime) -> int:
+    """Convert a datetime to unix seconds, treating naive datetimes as UTC"""
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return int(time.timestamp())
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    """Convert unix seconds to a naive UTC datetime"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def memoize_diskcache(cache: diskcache.Cache,
+                      version: int = 1,
+                      expire: Optional[float] = None):
     def decorator(func):
         """
         Memoizing cache decorator.
         Decorator to wrap callable with memoizing function using cache.
         Repeated calls with the same arguments will lookup result in cache and
         avoid function evaluation.
+        Results expire after expire seconds. Bump version when the function's
+        results change shape, old entries are then never read again and get
+        evicted by the cache's size limit.
+        On a miss, processes sharing the cache take turns, so only the first
+        one evaluates the function and the others read its result.
         """
         @wraps(func)
         def wrapper(self, *args, **kwargs):
@@ -41,14 +91,26 @@ def memoize_diskcache(cache: diskcache.Cache):
             result = cache.get(key, default=diskcache.ENOVAL, retry=True)
 
             if result is diskcache.ENOVAL:
-                result = func(self, *args, **kwargs)
-                cache.set(key, result, retry=True)
+                # expires in case the process holding it dies
+                with diskcache.Lock(cache, ('lock', ) + key, expire=60):
+                    result = cache.get(key,
+                                       default=diskcache.ENOVAL,
+                                       retry=True)
+                    if result is diskcache.ENOVAL:
+                        instrument.count(f'cache.{func.__qualname__}.miss')
+                        result = func(self, *args, **kwargs)
+                        cache.set(key, result, expire=expire, retry=True)
+                    else:
+                        instrument.count(
+                            f'cache.{func.__qualname__}.coalesced')
+            else:
+                instrument.count(f'cache.{func.__qualname__}.hit')
 
             return result
 
         def __cache_key__(*args, **kwargs):
             "Make key for cache given function arguments."
-            key = (func.__module__ + '.' + func.__qualname__, ) + args
+            key = (func.__module__ + '.' + func.__qualname__, version) + args
             if kwargs:
                 key += (diskcache.ENOVAL, )
                 for item in sorted(kwargs.items()):
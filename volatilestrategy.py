@@ -1,48 +1,78 @@
 from datetime import datetime, timedelta
-from pprint import pprint
+from typing import Optional
+
+import numpy as np
 
 from downloader import Downloader
 from main import run_strategy
+from screener import Screener
 from strategy import Strategy
 from trader import OrderType, Side, Trader
 
 
 class VolatileStrategy(Strategy):
     """A strategy that finds volatile assets and does grid trading on them"""
+    LOOKBACK = timedelta(hours=1)  # volatility is measured over the last hour
+    SCREEN_BLOCK = timedelta(days=1)  # of candles screened at once
+
     def trade(self, trader: Trader):
         product = self.find_volatile_tickers()[0]['id']
         # buy $10 of the most volatile product
         trader.place_order(product,
                            side=Side.BUY,
                            order_type=OrderType.MARKET,
-                           price=10)
+                           funds=10)
 
     def download_data(self, downloader: Downloader):
-        start = self.start_time - timedelta(hours=1)
-        end = self.start_time
+        # products can be rescreened at any time until the backtest ends
+        start = self.start_time - self.LOOKBACK
+        end = max(self.end_time or self.start_time, self.start_time)
 
+        # filter only USD pairs, of the universe when one is given
         self.products = [
-            p for p in downloader.product_list() if p['id'].endswith('-USD')
-        ]  # filter only USD pairs
-
-        self.product_data = {
-            p['id']: downloader.historical_data(p['id'], start, end)
-            for p in self.products
-        }
-
-    def find_volatile_tickers(self):
-        """Returns a list of assets sorted by volatility over the last our of trading"""
-        product_variance = [{
-            'id': p['id'],
-            'volatility': self.calculate_product_volatility(p)
-        } for p in self.products]
-        product_variance.sort(key=lambda p: p['volatility'], reverse=True)
-        return product_variance
-
-    def calculate_product_volatility(self, product: dict[str, str]) -> float:
-        data = self.product_data[product['id']]
-        return self.avg_percent_volatility(data)
-        # return self.avg_close_price_percent_diff(data)
+            p for p in downloader.product_list()
+            if p['id'].endswith('-USD') and (
+                self.universe is None or p['id'] in self.universe)
+        ]
+
+        # download every product concurrently
+        self.granularity = downloader.granularity_for(self.LOOKBACK)
+        self.product_data = downloader.backfill_many(
+            [p['id'] for p in self.products], start, end, self.granularity)
+        self.block: Optional[datetime] = None  # start of the screened block
+
+    def screen(self, time: datetime) -> tuple[Screener, np.ndarray]:
+        """
+        Screener of the block of candles time falls in, and the volatility
+        of every product over the hour before each candle. Blocks are
+        SCREEN_BLOCK long, so memory doesn't grow with the backtest.
+        """
+        blocks = max(0, -((self.start_time - time) // self.SCREEN_BLOCK) - 1)
+        block = self.start_time + blocks * self.SCREEN_BLOCK
+        if block != self.block:
+            self.block = block
+            self.screener = Screener(self.product_data, self.granularity,
+                                     block - self.LOOKBACK,
+                                     block + self.SCREEN_BLOCK)
+            self.volatility = self.screener.volatility(
+                self.LOOKBACK // timedelta(seconds=self.granularity))
+        return self.screener, self.volatility
+
+    def find_volatile_tickers(self,
+                              time: Optional[datetime] = None,
+                              k: Optional[int] = None) -> list[dict]:
+        """
+        Returns the k most volatile assets over the hour before time (all of
+        them, at start_time by default), most volatile first. time can be
+        anywhere from start_time to end_time.
+        """
+        time = time or self.start_time
+        screener, volatility = self.screen(time)
+        ranked = screener.rank(volatility, k or len(self.products), time)
+        return [{
+            'id': product_id,
+            'volatility': volatility
+        } for product_id, volatility in ranked]
 
 
 if __name__ == '__main__':